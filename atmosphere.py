@@ -1,5 +1,18 @@
 import math
 
+import numpy as np
+
+# Define atmospheric layers (base geopotential height [m], base temperature [K], lapse rate [K/m], base pressure [Pa])
+LAYERS = [
+    (0, 288.15, -0.0065, 101325.0),
+    (11000, 216.65, 0.0, 22632.06),
+    (20000, 216.65, 0.001, 5474.889),
+    (32000, 228.65, 0.0028, 868.019),
+    (47000, 270.65, 0.0, 110.906),
+    (51000, 270.65, -0.0028, 66.9389),
+    (71000, 214.65, -0.002, 3.95642),
+]
+
 
 def ussa1976(h):
     """
@@ -11,26 +24,15 @@ def ussa1976(h):
     g0 = 9.80665  # m/s^2
     R = 287.05287  # J/(kg*K), specific gas constant for dry air
 
-    # Define atmospheric layers (base geopotential height [m], base temperature [K], lapse rate [K/m], base pressure [Pa])
-    layers = [
-        (0, 288.15, -0.0065, 101325.0),
-        (11000, 216.65, 0.0, 22632.06),
-        (20000, 216.65, 0.001, 5474.889),
-        (32000, 228.65, 0.0028, 868.019),
-        (47000, 270.65, 0.0, 110.906),
-        (51000, 270.65, -0.0028, 66.9389),
-        (71000, 214.65, -0.002, 3.95642),
-    ]
-
     # Determine which layer h is in
-    for i in range(len(layers) - 1):
-        h_b, T_b, L_b, p_b = layers[i]
-        h_next = layers[i + 1][0]
+    for i in range(len(LAYERS) - 1):
+        h_b, T_b, L_b, p_b = LAYERS[i]
+        h_next = LAYERS[i + 1][0]
         if h < h_next:
             break
     else:
         # If higher than last defined layer (71 km), use the last one (valid to 86 km)
-        h_b, T_b, L_b, p_b = layers[-1]
+        h_b, T_b, L_b, p_b = LAYERS[-1]
 
     # Calculate temperature at altitude
     if L_b == 0.0:
@@ -47,3 +49,32 @@ def ussa1976(h):
     # Density from ideal gas law
     rho = p / (R * T)
     return rho
+
+
+# LAYERS as arrays for the vectorised version
+_H_B, _T_B, _L_B, _P_B = np.array(LAYERS, dtype=float).T
+
+
+def ussa1976_array(h):
+    """
+    Vectorised version of ussa1976 for an array of altitudes h [m].
+    h can be complex (for complex-step derivatives), the layer is picked from the real part.
+    """
+    g0 = 9.80665
+    R = 287.05287
+
+    i = np.clip(np.searchsorted(_H_B, np.real(h), side="right") - 1, 0, len(_H_B) - 1)
+    h_b, T_b, L_b, p_b = _H_B[i], _T_B[i], _L_B[i], _P_B[i]
+
+    T = T_b + L_b * (h - h_b)
+
+    # Avoid dividing by zero in the branch that np.where throws away
+    isothermal = L_b == 0.0
+    L_safe = np.where(isothermal, 1.0, L_b)
+    p = np.where(
+        isothermal,
+        p_b * np.exp(-g0 * (h - h_b) / (R * T_b)),
+        p_b * (T_b / T) ** (g0 / (R * L_safe)),
+    )
+
+    return p / (R * T)
@@ -0,0 +1,513 @@
+"""
+Gain-scheduled autopilot for batch simulations.
+
+Provides pitch attitude and altitude hold on the elevator, roll attitude and heading hold on
+the ailerons, and an autothrottle on thrust_N. Everything works on batch states (see
+batch_solver.py), so one Autopilot flies every aircraft in the batch at once.
+
+The gains come from a table over altitude and airspeed, built once by trimming and
+linearising the model at each grid point (build_schedule). During the simulation the
+gains are interpolated from the table at a slow rate and held in between, and each
+controller runs at its own fixed rate, holding its output until its next update.
+
+The controller updates only use preallocated buffers (every NumPy operation writes into
+an existing array with out=), so calling them every step doesn't allocate anything. Only
+the gain interpolation allocates, and that only runs at the schedule rate.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+import batch_solver
+import trimmer
+from aircraft import AircraftState, AircraftCoeffs, AircraftPhysicalProperties
+
+DEG2RAD = np.pi / 180
+g = 9.81
+
+GAIN_NAMES = (
+    "de_trim",
+    "thrust_trim",
+    "tht_trim",
+    "K_tht",
+    "K_q",
+    "K_phi",
+    "K_p",
+    "K_V",
+    "K_Vi",
+    "K_h",
+    "K_psi",
+)
+
+
+@dataclass
+class LoopDesign:
+    """
+    Closed loop targets the gains are designed for at every grid point.
+    """
+
+    pitch_wn: float = 2.0  # rad/s, pitch attitude loop natural frequency
+    pitch_zeta: float = 0.7
+    roll_wn: float = 2.5  # rad/s, roll attitude loop natural frequency
+    roll_zeta: float = 0.7
+    speed_wn: float = 0.3  # rad/s, autothrottle
+    speed_zeta: float = 0.9
+    altitude_bw: float = 0.15  # rad/s, altitude to pitch command
+    heading_bw: float = 0.1  # rad/s, heading to roll command
+
+
+class GainSchedule:
+    """
+    Table of gains and trim values over an altitude x airspeed grid, shape (n_altitudes, n_airspeeds).
+    """
+
+    def __init__(
+        self, altitudes_m: np.ndarray, airspeeds_m_s: np.ndarray, tables: dict
+    ):
+        self.altitudes_m = np.asarray(altitudes_m, dtype=float)
+        self.airspeeds_m_s = np.asarray(airspeeds_m_s, dtype=float)
+        self.tables = tables
+
+    def interpolate(
+        self, altitude_m: np.ndarray, tas_m_s: np.ndarray, out: "ScheduledGains"
+    ):
+        """
+        Bilinear interpolation of every table at each aircraft's altitude and airspeed, into out.
+        Outside the grid the edge values are used.
+        """
+        i, fi = _cell(self.altitudes_m, altitude_m)
+        j, fj = _cell(self.airspeeds_m_s, tas_m_s)
+
+        for name, table in self.tables.items():
+            value = (
+                (1 - fi) * (1 - fj) * table[i, j]
+                + fi * (1 - fj) * table[i + 1, j]
+                + (1 - fi) * fj * table[i, j + 1]
+                + fi * fj * table[i + 1, j + 1]
+            )
+            np.copyto(getattr(out, name), value)
+
+
+def _cell(grid: np.ndarray, x: np.ndarray):
+    # Index of the grid cell each x is in, and how far across it, clamped to the grid
+    if len(grid) == 1:
+        return np.zeros(np.shape(x), dtype=int), np.zeros(np.shape(x))
+    i = np.clip(np.searchsorted(grid, x) - 1, 0, len(grid) - 2)
+    frac = np.clip((x - grid[i]) / (grid[i + 1] - grid[i]), 0.0, 1.0)
+    return i, frac
+
+
+def _linearise(
+    trimmed: AircraftState,
+    coeffs: AircraftCoeffs,
+    props: AircraftPhysicalProperties,
+    eps: float = 1e-4,
+):
+    """
+    Central difference derivatives of qdot and pdot about a batch of trim points.
+    Every perturbation of every trim point goes through batch_solver.dxdt in one call.
+    Returns M_q, M_de, L_p, L_da, each shaped (n,).
+    """
+    perturbations = [("q_rad_s", 10), ("de_rad", 10), ("p_rad_s", 9), ("da_rad", 9)]
+    n = len(trimmed.u_m_s)
+    n_copies = 2 * len(perturbations)
+
+    # Copy k of the trim points is batch[k * n : (k + 1) * n]
+    batch = batch_solver.stack(batch_solver.unstack(trimmed) * n_copies)
+    for k, (name, _) in enumerate(perturbations):
+        value = getattr(batch, name)
+        value[2 * k * n : (2 * k + 1) * n] += eps
+        value[(2 * k + 1) * n : (2 * k + 2) * n] -= eps
+
+    xdot = batch_solver.dxdt(batch, coeffs, props).reshape(12, n_copies, n)
+
+    derivatives = []
+    for k, (_, row) in enumerate(perturbations):
+        derivatives.append((xdot[row, 2 * k] - xdot[row, 2 * k + 1]) / (2 * eps))
+    return derivatives
+
+
+def build_schedule(
+    props: AircraftPhysicalProperties,
+    coeffs: AircraftCoeffs,
+    altitudes_m: list[float],
+    airspeeds_m_s: list[float],
+    design: LoopDesign = LoopDesign(),
+) -> GainSchedule:
+    """
+    Trim and linearise the aircraft at every altitude/airspeed grid point in level flight, and
+    design the loop gains there.
+
+    Each inner loop is treated as a second order system, e.g. tht'' = M_q q + M_de de for
+    pitch, and its gains placed to give the natural frequency and damping in `design`.
+    The outer loops use the kinematics: hdot ~ V tht and psidot ~ g/V phi.
+    """
+    altitudes_m = np.asarray(altitudes_m, dtype=float)
+    airspeeds_m_s = np.asarray(airspeeds_m_s, dtype=float)
+
+    # Trim every grid point, starting each from the last solution to help the optimiser
+    trimmed = []
+    fpa_rad = 0.0
+    x0 = [0, 0, 0]
+    for h in altitudes_m:
+        for V in airspeeds_m_s:
+            state = trimmer.trim(h, V, fpa_rad, props, coeffs, x0)
+            # The trimmer solves for [aph, de, thrust]
+            x0 = [state.tht_rad - fpa_rad, state.de_rad, state.thrust_N]
+            trimmed.append(state)
+    trimmed = batch_solver.stack(trimmed)
+
+    M_q, M_de, L_p, L_da = _linearise(trimmed, coeffs, props)
+    V = np.tile(airspeeds_m_s, len(altitudes_m))
+    d = design
+
+    gains = {
+        "de_trim": trimmed.de_rad,
+        "thrust_trim": trimmed.thrust_N,
+        "tht_trim": trimmed.tht_rad,
+        # de = de_trim + K_tht (tht - tht_cmd) + K_q q
+        "K_tht": -(d.pitch_wn**2) / M_de,
+        "K_q": (-2 * d.pitch_zeta * d.pitch_wn - M_q) / M_de,
+        # da = K_phi (phi_cmd - phi) - K_p p
+        "K_phi": d.roll_wn**2 / L_da,
+        "K_p": (L_p + 2 * d.roll_zeta * d.roll_wn) / L_da,
+        # thrust = thrust_trim + K_V (V_cmd - V) + K_Vi integral(V_cmd - V), with udot ~ thrust / m
+        "K_V": 2 * d.speed_zeta * d.speed_wn * props.mass * np.ones_like(V),
+        "K_Vi": d.speed_wn**2 * props.mass * np.ones_like(V),
+        # tht_cmd = tht_trim + K_h (h_cmd - h)
+        "K_h": d.altitude_bw / V,
+        # phi_cmd = K_psi (psi_cmd - psi)
+        "K_psi": d.heading_bw * V / g,
+    }
+
+    shape = (len(altitudes_m), len(airspeeds_m_s))
+    tables = {
+        name: np.asarray(gains[name], dtype=float).reshape(shape) for name in GAIN_NAMES
+    }
+    return GainSchedule(altitudes_m, airspeeds_m_s, tables)
+
+
+class ScheduledGains:
+    """
+    The current interpolated gains for each aircraft in the batch, one (n,) array per gain.
+    """
+
+    def __init__(self, n: int):
+        for name in GAIN_NAMES:
+            setattr(self, name, np.zeros(n))
+
+
+class AirData:
+    """
+    True airspeed for each aircraft in the batch, from the ground-relative state velocities
+    and the current wind. Everything is worked out in preallocated buffers.
+
+    wind_ned and gust_b are the same as for batch_solver.step, and are set by
+    Autopilot.update every step. Leave them as None for calm air.
+    """
+
+    def __init__(self, n: int):
+        self.wind_ned = None
+        self.gust_b = None
+        self._c = np.zeros(n)
+        self._s = np.zeros(n)
+        self._tmp = np.zeros(n)
+        self._a = np.zeros(n)
+        self._b = np.zeros(n)
+        self._wind_b = np.zeros((3, n))
+
+    def _rotate_wind(self, state: AircraftState):
+        # wind_b = R_bi wind_ned, with R_bi from solver.rotation_body_from_inertial written
+        # out one rotation at a time: yaw, then pitch, then roll
+        w_n, w_e, w_d = self.wind_ned
+        c, s, tmp, a, b = self._c, self._s, self._tmp, self._a, self._b
+        u_w, v_w, w_w = self._wind_b
+
+        # Yaw: a along the heading, b to the right of it
+        np.cos(state.psi_rad, out=c)
+        np.sin(state.psi_rad, out=s)
+        np.multiply(c, w_n, out=a)
+        np.multiply(s, w_e, out=tmp)
+        np.add(a, tmp, out=a)
+        np.multiply(c, w_e, out=b)
+        np.multiply(s, w_n, out=tmp)
+        np.subtract(b, tmp, out=b)
+
+        # Pitch: u_w = c a - s w_d, and a becomes c w_d + s a
+        np.cos(state.tht_rad, out=c)
+        np.sin(state.tht_rad, out=s)
+        np.multiply(c, a, out=u_w)
+        np.multiply(s, w_d, out=tmp)
+        np.subtract(u_w, tmp, out=u_w)
+        np.multiply(s, a, out=a)
+        np.multiply(c, w_d, out=tmp)
+        np.add(a, tmp, out=a)
+
+        # Roll: v_w = c b + s a, w_w = c a - s b
+        np.cos(state.phi_rad, out=c)
+        np.sin(state.phi_rad, out=s)
+        np.multiply(c, b, out=v_w)
+        np.multiply(s, a, out=tmp)
+        np.add(v_w, tmp, out=v_w)
+        np.multiply(c, a, out=w_w)
+        np.multiply(s, b, out=tmp)
+        np.subtract(w_w, tmp, out=w_w)
+
+    def true_airspeed(self, state: AircraftState, out: np.ndarray) -> np.ndarray:
+        """
+        |v_b - wind_b - gust_b|, written into out.
+        """
+        self._wind_b.fill(0.0)
+        if self.wind_ned is not None:
+            self._rotate_wind(state)
+        if self.gust_b is not None:
+            for i in range(3):
+                np.add(self._wind_b[i], self.gust_b[i], out=self._wind_b[i])
+
+        out.fill(0.0)
+        for i, v in enumerate((state.u_m_s, state.v_m_s, state.w_m_s)):
+            np.subtract(v, self._wind_b[i], out=self._tmp)
+            np.multiply(self._tmp, self._tmp, out=self._tmp)
+            np.add(out, self._tmp, out=out)
+        return np.sqrt(out, out=out)
+
+
+class Controller:
+    """
+    Base for a controller that updates at a fixed rate and holds its output in between.
+    Subclasses preallocate everything they need in __init__ and implement _update.
+    """
+
+    def __init__(self, n: int, rate_hz: float):
+        self.n = n
+        self.period = 1 / rate_hz
+        self.enabled = True
+        self._next_t = 0.0
+
+    def reset(self, t: float = 0.0):
+        self._next_t = t
+
+    def update(self, t: float, state: AircraftState, gains: ScheduledGains):
+        # The small tolerance stops float round off in t from skipping an update
+        if self.enabled and t >= self._next_t - 1e-9:
+            self._update(state, gains)
+            self._next_t += self.period
+
+    def _update(self, state: AircraftState, gains: ScheduledGains):
+        raise NotImplementedError
+
+
+class PitchHold(Controller):
+    def __init__(self, n: int, rate_hz: float = 50, de_limit_rad: float = 20 * DEG2RAD):
+        super().__init__(n, rate_hz)
+        self.de_limit_rad = de_limit_rad
+        self.command = np.zeros(n)  # tht_rad
+        self.de = np.zeros(n)
+        self._tmp = np.zeros(n)
+
+    def _update(self, state, gains):
+        # de = de_trim + K_tht (tht - tht_cmd) + K_q q
+        np.subtract(state.tht_rad, self.command, out=self.de)
+        np.multiply(gains.K_tht, self.de, out=self.de)
+        np.multiply(gains.K_q, state.q_rad_s, out=self._tmp)
+        np.add(self.de, self._tmp, out=self.de)
+        np.add(self.de, gains.de_trim, out=self.de)
+        np.clip(self.de, -self.de_limit_rad, self.de_limit_rad, out=self.de)
+
+
+class AltitudeHold(Controller):
+    def __init__(
+        self,
+        n: int,
+        pitch: PitchHold,
+        rate_hz: float = 10,
+        tht_limit_rad: float = 10 * DEG2RAD,
+    ):
+        super().__init__(n, rate_hz)
+        self.pitch = pitch
+        self.tht_limit_rad = tht_limit_rad
+        self.command = np.zeros(n)  # altitude_m
+
+    def _update(self, state, gains):
+        # tht_cmd = tht_trim + K_h (h_cmd - h), limited to +/- tht_limit_rad around trim
+        cmd = self.pitch.command
+        np.subtract(self.command, state.altitude_m, out=cmd)
+        np.multiply(gains.K_h, cmd, out=cmd)
+        np.clip(cmd, -self.tht_limit_rad, self.tht_limit_rad, out=cmd)
+        np.add(cmd, gains.tht_trim, out=cmd)
+
+
+class RollHold(Controller):
+    def __init__(self, n: int, rate_hz: float = 50, da_limit_rad: float = 20 * DEG2RAD):
+        super().__init__(n, rate_hz)
+        self.da_limit_rad = da_limit_rad
+        self.command = np.zeros(n)  # phi_rad
+        self.da = np.zeros(n)
+        self._tmp = np.zeros(n)
+
+    def _update(self, state, gains):
+        # da = K_phi (phi_cmd - phi) - K_p p
+        np.subtract(self.command, state.phi_rad, out=self.da)
+        np.multiply(gains.K_phi, self.da, out=self.da)
+        np.multiply(gains.K_p, state.p_rad_s, out=self._tmp)
+        np.subtract(self.da, self._tmp, out=self.da)
+        np.clip(self.da, -self.da_limit_rad, self.da_limit_rad, out=self.da)
+
+
+class HeadingHold(Controller):
+    def __init__(
+        self,
+        n: int,
+        roll: RollHold,
+        rate_hz: float = 10,
+        phi_limit_rad: float = 25 * DEG2RAD,
+    ):
+        super().__init__(n, rate_hz)
+        self.roll = roll
+        self.phi_limit_rad = phi_limit_rad
+        self.command = np.zeros(n)  # psi_rad
+
+    def _update(self, state, gains):
+        # phi_cmd = K_psi (psi_cmd - psi), with the heading error wrapped to +/- pi
+        cmd = self.roll.command
+        np.subtract(self.command, state.psi_rad, out=cmd)
+        np.add(cmd, np.pi, out=cmd)
+        np.mod(cmd, 2 * np.pi, out=cmd)
+        np.subtract(cmd, np.pi, out=cmd)
+        np.multiply(gains.K_psi, cmd, out=cmd)
+        np.clip(cmd, -self.phi_limit_rad, self.phi_limit_rad, out=cmd)
+
+
+class Autothrottle(Controller):
+    def __init__(
+        self,
+        n: int,
+        max_thrust_N: float,
+        air_data: AirData | None = None,
+        rate_hz: float = 10,
+    ):
+        super().__init__(n, rate_hz)
+        self.max_thrust_N = max_thrust_N
+        self.air_data = AirData(n) if air_data is None else air_data
+        self.command = np.zeros(n)  # airspeed, m/s
+        self.thrust = np.zeros(n)
+        self.integral = np.zeros(n)
+        self._err = np.zeros(n)
+        self._tmp = np.zeros(n)
+        self._excess = np.zeros(n)
+        self._no_integral = np.zeros(n, dtype=bool)
+        self._has_integral = np.zeros(n, dtype=bool)
+
+    def reset(self, t: float = 0.0):
+        super().reset(t)
+        self.integral[:] = 0.0
+
+    def _update(self, state, gains):
+        self.air_data.true_airspeed(state, out=self._err)
+        np.subtract(self.command, self._err, out=self._err)
+
+        # thrust = thrust_trim + K_V e + K_Vi integral(e)
+        np.multiply(self._err, self.period, out=self._tmp)
+        np.add(self.integral, self._tmp, out=self.integral)
+        np.multiply(gains.K_Vi, self.integral, out=self.thrust)
+        np.multiply(gains.K_V, self._err, out=self._tmp)
+        np.add(self.thrust, self._tmp, out=self.thrust)
+        np.add(self.thrust, gains.thrust_trim, out=self.thrust)
+
+        # Saturate, and take back whatever part of the integral pushed past the limit so it
+        # doesn't wind up while saturated
+        np.clip(self.thrust, 0.0, self.max_thrust_N, out=self._tmp)
+        np.subtract(self.thrust, self._tmp, out=self._excess)
+        np.equal(gains.K_Vi, 0.0, out=self._no_integral)
+        np.logical_not(self._no_integral, out=self._has_integral)
+        np.divide(self._excess, gains.K_Vi, out=self._excess, where=self._has_integral)
+        np.subtract(self.integral, self._excess, out=self.integral)
+        # P only where there's no integral gain, so there's no integral to hold
+        np.copyto(self.integral, 0.0, where=self._no_integral)
+        np.copyto(self.thrust, self._tmp)
+
+
+class Autopilot:
+    """
+    All the loops together for a batch of n aircraft.
+
+    Set the commands through the outer loops (altitude.command, heading.command,
+    autothrottle.command), or disable an outer loop and set the inner loop command directly
+    (e.g. autopilot.altitude.enabled = False, then set autopilot.pitch.command). Call update()
+    every simulation step before batch_solver.step, with the same wind_ned and gust_b, so the
+    autothrottle and the gain schedule work from true airspeed rather than ground speed.
+    """
+
+    def __init__(
+        self,
+        schedule: GainSchedule,
+        n: int,
+        max_thrust_N: float = np.inf,
+        schedule_rate_hz: float = 1,
+    ):
+        self.schedule = schedule
+        self.gains = ScheduledGains(n)
+        self.schedule_period = 1 / schedule_rate_hz
+        self._next_schedule_t = 0.0
+        self.air_data = AirData(n)
+        self.tas_m_s = np.zeros(n)
+
+        self.pitch = PitchHold(n)
+        self.altitude = AltitudeHold(n, self.pitch)
+        self.roll = RollHold(n)
+        self.heading = HeadingHold(n, self.roll)
+        self.autothrottle = Autothrottle(n, max_thrust_N, self.air_data)
+
+        # Outer loops first so the inner loops see fresh commands
+        self.controllers = [
+            self.altitude,
+            self.heading,
+            self.pitch,
+            self.roll,
+            self.autothrottle,
+        ]
+
+    def engage(self, t: float, state: AircraftState, wind_ned=None, gust_b=None):
+        """
+        Hold the current altitude, heading and airspeed, and start every loop from time t.
+        """
+        self.air_data.wind_ned = wind_ned
+        self.air_data.gust_b = gust_b
+
+        self.altitude.command[:] = state.altitude_m
+        self.heading.command[:] = state.psi_rad
+        self.air_data.true_airspeed(state, out=self.autothrottle.command)
+        self.pitch.command[:] = state.tht_rad
+        self.roll.command[:] = state.phi_rad
+
+        self._next_schedule_t = t
+        for controller in self.controllers:
+            controller.reset(t)
+
+    def update(self, t: float, state: AircraftState, wind_ned=None, gust_b=None):
+        """
+        Run whichever loops are due at time t and write the control outputs into state.
+        state must be a batch state with array control fields. wind_ned and gust_b are the
+        same as for batch_solver.step.
+        """
+        self.air_data.wind_ned = wind_ned
+        self.air_data.gust_b = gust_b
+
+        if t >= self._next_schedule_t - 1e-9:
+            self._update_gains(state)
+            self._next_schedule_t += self.schedule_period
+
+        for controller in self.controllers:
+            controller.update(t, state, self.gains)
+
+        if self.pitch.enabled:
+            np.copyto(state.de_rad, self.pitch.de)
+        if self.roll.enabled:
+            np.copyto(state.da_rad, self.roll.da)
+        if self.autothrottle.enabled:
+            np.copyto(state.thrust_N, self.autothrottle.thrust)
+
+    def _update_gains(self, state: AircraftState):
+        self.air_data.true_airspeed(state, out=self.tas_m_s)
+        self.schedule.interpolate(state.altitude_m, self.tas_m_s, self.gains)
@@ -0,0 +1,166 @@
+"""
+Vectorised version of solver.py for simulating a batch of aircraft at once.
+
+A batch is just an AircraftState whose fields are NumPy arrays of shape (n,) instead of
+floats, one element per aircraft. calculate_forces_and_moments.calculate already works on
+arrays, so the force model is shared with the single aircraft solver. AircraftCoeffs and
+AircraftPhysicalProperties fields can be floats (same for every aircraft) or (n,) arrays.
+
+Stepping a batch of n aircraft costs about the same Python overhead as stepping one, so for
+anything more than a handful of runs this is much faster than looping over solver.step.
+"""
+
+from dataclasses import fields
+
+import numpy as np
+from aircraft import AircraftState, AircraftCoeffs, AircraftPhysicalProperties
+
+import calculate_forces_and_moments
+import solver
+
+STATE_FIELDS = tuple(f.name for f in fields(AircraftState))
+
+
+def stack(states: list[AircraftState], dtype=float) -> AircraftState:
+    """
+    Combine a list of states into a batch state with (n,) array fields.
+    The equations also work with complex states, for complex-step derivatives.
+    """
+    batch = AircraftState()
+    for name in STATE_FIELDS:
+        setattr(batch, name, np.array([getattr(s, name) for s in states], dtype=dtype))
+    return batch
+
+
+def repeat(state: AircraftState, n: int, dtype=float) -> AircraftState:
+    """
+    A batch of n copies of one state, e.g. n runs starting from the same trim point.
+    """
+    return stack([state] * n, dtype)
+
+
+def unstack(batch: AircraftState) -> list[AircraftState]:
+    """
+    Split a batch state back into a list of ordinary states.
+    """
+    n = len(batch.u_m_s)
+    return [
+        AircraftState(**{name: float(getattr(batch, name)[i]) for name in STATE_FIELDS})
+        for i in range(n)
+    ]
+
+
+def dxdt(
+    state: AircraftState,
+    coeffs: AircraftCoeffs,
+    props: AircraftPhysicalProperties,
+    wind_ned=None,
+    gust_b=None,
+):
+    """
+    Same equations as solver.dxdt, for a batch. Returns the state derivative, shape (12, n).
+    wind_ned and gust_b can be shaped (3,) to apply to every aircraft or (3, n).
+    """
+    phi, tht = state.phi_rad, state.tht_rad
+    c_phi = np.cos(phi)
+    s_phi = np.sin(phi)
+    c_tht = np.cos(tht)
+    t_tht = np.tan(tht)
+
+    # Body frame to inertial frame ZYX rotation matrix, shape (3, 3, n)
+    R_bi = solver.rotation_body_from_inertial(phi, tht, state.psi_rad)
+
+    # Wind in the body frame
+    wind_b = None
+    if wind_ned is not None:
+        wind_ned = np.asarray(wind_ned, dtype=float).reshape(3, -1)
+        wind_b = np.einsum("ijn,jn->in", R_bi, wind_ned)
+    if gust_b is not None:
+        gust_b = np.asarray(gust_b, dtype=float).reshape(3, -1)
+        wind_b = gust_b if wind_b is None else wind_b + gust_b
+
+    # Calculate forces/moments
+    FX, FY, FZ, Mx, My, Mz = calculate_forces_and_moments.calculate(
+        state, coeffs, props, wind_b
+    )
+
+    u, v, w = state.u_m_s, state.v_m_s, state.w_m_s
+    p, q, r = state.p_rad_s, state.q_rad_s, state.r_rad_s
+    m = props.mass
+    Ixx, Iyy, Izz, Ixz = props.Ixx, props.Iyy, props.Izz, props.Ixz
+
+    # Position, ground-relative. R_ib is just the transpose of R_bi
+    Pdot = np.einsum("jin,jn->in", R_bi, np.array([u, v, w]))
+
+    # Euler angle rates, the inverse kinematic matrix written out
+    phidot = p + (q * s_phi + r * c_phi) * t_tht
+    thtdot = q * c_phi - r * s_phi
+    psidot = (q * s_phi + r * c_phi) / c_tht
+
+    # Translational accelerations: F/m - w x v
+    udot = FX / m - (q * w - r * v)
+    vdot = FY / m - (r * u - p * w)
+    wdot = FZ / m - (p * v - q * u)
+
+    # Rotational accelerations: I^-1 (M - w x Iw), with the inverse of the
+    # symmetric-aircraft inertia matrix written out
+    Hx = Ixx * p - Ixz * r
+    Hy = Iyy * q
+    Hz = Izz * r - Ixz * p
+    Mx = Mx - (q * Hz - r * Hy)
+    My = My - (r * Hx - p * Hz)
+    Mz = Mz - (p * Hy - q * Hx)
+
+    gamma = Ixx * Izz - Ixz**2
+    pdot = (Izz * Mx + Ixz * Mz) / gamma
+    qdot = My / Iyy
+    rdot = (Ixz * Mx + Ixx * Mz) / gamma
+
+    return np.array(
+        [
+            Pdot[0],
+            Pdot[1],
+            Pdot[2],
+            phidot,
+            thtdot,
+            psidot,
+            udot,
+            vdot,
+            wdot,
+            pdot,
+            qdot,
+            rdot,
+        ]
+    )
+
+
+def step(
+    dt: float,
+    state: AircraftState,
+    coeffs: AircraftCoeffs,
+    props: AircraftPhysicalProperties,
+    wind_ned=None,
+    gust_b=None,
+):
+    """
+    Take an Euler integration step for every aircraft in the batch. Updates state in place and returns it.
+    """
+    xdot = dxdt(state, coeffs, props, wind_ned, gust_b)
+
+    state.x_m = state.x_m + dt * xdot[0]
+    state.y_m = state.y_m + dt * xdot[1]
+    state.altitude_m = state.altitude_m - dt * xdot[2]
+
+    state.phi_rad = state.phi_rad + dt * xdot[3]
+    state.tht_rad = state.tht_rad + dt * xdot[4]
+    state.psi_rad = state.psi_rad + dt * xdot[5]
+
+    state.u_m_s = state.u_m_s + dt * xdot[6]
+    state.v_m_s = state.v_m_s + dt * xdot[7]
+    state.w_m_s = state.w_m_s + dt * xdot[8]
+
+    state.p_rad_s = state.p_rad_s + dt * xdot[9]
+    state.q_rad_s = state.q_rad_s + dt * xdot[10]
+    state.r_rad_s = state.r_rad_s + dt * xdot[11]
+
+    return state
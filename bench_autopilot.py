@@ -0,0 +1,74 @@
+"""
+Benchmark the per-call overhead of the autopilot against a batch_solver step,
+for a range of batch sizes.
+"""
+
+import time
+import tracemalloc
+
+import autopilot
+import B737
+import batch_solver
+import trimmer
+
+BATCH_SIZES = [1, 10, 100, 1000, 10000]
+N_CALLS = 500
+DT = 0.01
+
+
+def time_per_call(fn, n_calls: int) -> float:
+    start = time.perf_counter()
+    for i in range(n_calls):
+        fn(i)
+    return (time.perf_counter() - start) / n_calls
+
+
+def main():
+    props, coeffs = B737.get_737_500_info()
+    schedule = autopilot.build_schedule(
+        props, coeffs, [500, 1500, 3000], [70, 85, 100, 120]
+    )
+    trimmed_state = trimmer.trim(1524, 100, 0.0, props, coeffs)
+
+    print(
+        f"{'n':>6} {'autopilot [us]':>15} {'controllers [us]':>17} "
+        f"{'step [us]':>10} {'temp bytes':>11}"
+    )
+    for n in BATCH_SIZES:
+        state = batch_solver.repeat(trimmed_state, n)
+        ap = autopilot.Autopilot(schedule, n, props.max_thrust)
+        ap.engage(0.0, state)
+
+        # Full update, including the gain schedule refresh when it's due
+        t_ap = time_per_call(lambda i: ap.update(i * DT, state), N_CALLS)
+
+        # Just the controllers, all forced to run every call
+        def run_controllers(i):
+            for controller in ap.controllers:
+                controller._update(state, ap.gains)
+
+        t_ctrl = time_per_call(run_controllers, N_CALLS)
+
+        t_step = time_per_call(
+            lambda i: batch_solver.step(DT, state, coeffs, props), N_CALLS // 5
+        )
+
+        # Peak memory above the baseline while the controllers run - any temporary
+        # arrays would show up here
+        tracemalloc.start()
+        run_controllers(0)
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        for i in range(100):
+            run_controllers(i)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(
+            f"{n:6d} {t_ap * 1e6:15.1f} {t_ctrl * 1e6:17.1f} "
+            f"{t_step * 1e6:10.1f} {peak - baseline:11d}"
+        )
+
+
+if __name__ == "__main__":
+    main()
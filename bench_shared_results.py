@@ -0,0 +1,141 @@
+"""
+Benchmark the shared-memory result transport against returning pickled histories
+from worker processes.
+
+Two comparisons are made:
+- transport only: workers fill a history with cheap synthetic data, so the time is
+  almost entirely moving results back to the parent. This is what grows with batch size.
+- full simulation: short elevator pulse runs with the real solver, end to end.
+"""
+
+import copy
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import B737
+import shared_results
+import trimmer
+
+DEG2RAD = np.pi / 180
+
+# Transport-only settings, sized like a 60 s run at dt = 0.01
+TRANSPORT_BATCH_SIZES = [64, 256, 512]
+TRANSPORT_N_STEPS = 6001
+
+# Full simulation settings
+SIM_BATCH_SIZES = [8, 32]
+SIM_DT = 0.01
+SIM_T = 5
+
+MAX_WORKERS = None
+
+
+def _fill(buf: np.ndarray, run: int):
+    # Cheap stand-in for a simulation, touches every sample once
+    buf[:] = run
+    buf[0] = np.arange(buf.shape[1])
+
+
+def fill_shared(spec: shared_results.SharedHistorySpec, run: int):
+    history = shared_results.SharedHistory.attach(spec)
+    try:
+        _fill(history.data[run], run)
+        history.steps_written[run] = spec.n_steps
+    finally:
+        history.close()
+
+
+def fill_pickled(n_steps: int, run: int) -> np.ndarray:
+    buf = np.empty((len(shared_results.CHANNELS), n_steps))
+    _fill(buf, run)
+    return buf
+
+
+def bench_transport(pool: ProcessPoolExecutor, n_runs: int, n_steps: int):
+    start = time.perf_counter()
+    results = list(pool.map(fill_pickled, [n_steps] * n_runs, range(n_runs)))
+    stacked = np.stack(results)
+    t_pickled = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with shared_results.SharedHistory.create(n_runs, n_steps) as history:
+        list(pool.map(fill_shared, [history.spec] * n_runs, range(n_runs)))
+        t_shared = time.perf_counter() - start
+
+        # Check outside the timed section
+        assert history.complete().all()
+        assert np.array_equal(history.data, stacked)
+
+    return t_pickled, t_shared
+
+
+def bench_sim(pool: ProcessPoolExecutor, n_runs: int):
+    props, coeffs = B737.get_737_500_info()
+    trimmed_state = trimmer.trim(1524, 67, 0.0, props, coeffs)
+
+    # Each run gets a different sized elevator pulse from 1 to 2 s
+    n_steps = int(round(SIM_T / SIM_DT)) + 1
+    t = np.arange(n_steps) * SIM_DT
+    pulse = (t >= 1) & (t <= 2)
+    controls = np.zeros((n_runs, n_steps, 4))
+    controls[:, :, 0] = trimmed_state.de_rad
+    controls[:, :, 3] = trimmed_state.thrust_N
+    for run in range(n_runs):
+        controls[run, pulse, 0] -= (run + 1) / n_runs * 2 * DEG2RAD
+    states = [copy.deepcopy(trimmed_state) for _ in range(n_runs)]
+
+    start = time.perf_counter()
+    futures = [
+        pool.submit(
+            shared_results.simulate_pickled,
+            n_steps,
+            states[run],
+            coeffs,
+            props,
+            SIM_DT,
+            controls[run],
+        )
+        for run in range(n_runs)
+    ]
+    stacked = np.stack([f.result() for f in futures])
+    t_pickled = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with shared_results.run_batch(
+        states, coeffs, props, SIM_DT, SIM_T, controls, pool
+    ) as history:
+        t_shared = time.perf_counter() - start
+
+        # Check outside the timed section
+        assert np.allclose(history.data, stacked)
+
+    return t_pickled, t_shared
+
+
+def main():
+    with ProcessPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        # Warm up the pool so process start-up isn't counted
+        list(pool.map(fill_pickled, [1] * 4, range(4)))
+
+        print("Transport only")
+        for n_runs in TRANSPORT_BATCH_SIZES:
+            mb = n_runs * len(shared_results.CHANNELS) * TRANSPORT_N_STEPS * 8 / 1e6
+            t_pickled, t_shared = bench_transport(pool, n_runs, TRANSPORT_N_STEPS)
+            print(
+                f"  {n_runs:5d} runs ({mb:7.1f} MB): pickled {t_pickled:7.3f} s, "
+                f"shared {t_shared:7.3f} s, speedup {t_pickled / t_shared:5.2f}x"
+            )
+
+        print(f"Full simulation ({SIM_T} s per run)")
+        for n_runs in SIM_BATCH_SIZES:
+            t_pickled, t_shared = bench_sim(pool, n_runs)
+            print(
+                f"  {n_runs:5d} runs: pickled {t_pickled:7.3f} s, "
+                f"shared {t_shared:7.3f} s, speedup {t_pickled / t_shared:5.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
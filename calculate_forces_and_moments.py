@@ -6,20 +6,33 @@ based on the current aircraft state.
 import numpy as np
 
 from aircraft import AircraftState, AircraftCoeffs, AircraftPhysicalProperties
-from atmosphere import ussa1976
+from atmosphere import ussa1976, ussa1976_array
 
 
 def calculate(
-    state: AircraftState, coeffs: AircraftCoeffs, props: AircraftPhysicalProperties
+    state: AircraftState,
+    coeffs: AircraftCoeffs,
+    props: AircraftPhysicalProperties,
+    wind_b=None,
 ):
     """
     Calculates the body frame forces and moments: FX, FY, FZ, L, M, N
+    wind_b is an optional wind velocity in the body frame, the aero forces use the velocity relative to it.
     """
+    # Air-relative body velocities
+    u, v, w = state.u_m_s, state.v_m_s, state.w_m_s
+    if wind_b is not None:
+        u, v, w = u - wind_b[0], v - wind_b[1], w - wind_b[2]
+
     # Things we'll need, derived from the state
-    Vtas = np.sqrt(state.u_m_s**2 + state.v_m_s**2 + state.w_m_s**2)
-    bta = np.arcsin(state.v_m_s / Vtas)
-    aph = np.arcsin(state.w_m_s / (Vtas * np.cos(bta)))
-    rho = ussa1976(state.altitude_m)
+    Vtas = np.sqrt(u**2 + v**2 + w**2)
+    bta = np.arcsin(v / Vtas)
+    aph = np.arcsin(w / (Vtas * np.cos(bta)))
+    # The state fields can also be arrays when simulating a batch (see batch_solver.py)
+    if np.ndim(state.altitude_m) == 0:
+        rho = ussa1976(state.altitude_m)
+    else:
+        rho = ussa1976_array(state.altitude_m)
     qbar = 0.5 * rho * Vtas**2
     g = 9.81
 
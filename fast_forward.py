@@ -0,0 +1,212 @@
+"""
+Skip the force calculations while the aircraft is sitting in steady flight.
+
+Long runs spend most of their time in trimmed cruise where the state barely changes, but
+solver.step still calculates the forces and moments every step. FastForward.step is a drop
+in replacement for solver.step that watches the state derivative. Once it has stayed below
+the thresholds for a while, with the controls and wind unchanged, it holds the body
+velocities, rates and attitude constant and just moves the position along, which is exact
+in closed form: P(t + dt) = P(t) + R_ib v_b dt.
+
+Full integration picks up again on the first step where a control or the wind changes, when
+a periodic recheck of the derivative finds it's no longer quiet, or when the error bound for
+the segment gets too big.
+
+The error bound comes from the thresholds: while fast forwarding, the ignored accelerations
+are at most accel_m_s2 and the ignored attitude rates at most rate_rad_s, so after time tau
+- body velocities are out by at most accel_m_s2 * tau
+- attitude is out by at most rate_rad_s * tau
+- body rates are out by at most ang_accel_rad_s2 * tau
+- position is out by at most (accel_m_s2 + V * rate_rad_s) * tau^2 / 2
+This assumes the derivative stays under the thresholds between rechecks.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+from aircraft import AircraftState, AircraftCoeffs, AircraftPhysicalProperties
+
+import solver
+
+
+@dataclass
+class Thresholds:
+    accel_m_s2: float = 1e-4  # |udot|, |vdot|, |wdot|
+    ang_accel_rad_s2: float = 1e-5  # |pdot|, |qdot|, |rdot|
+    rate_rad_s: float = 1e-5  # |phidot|, |thtdot|, |psidot|
+
+    # How long the derivative has to stay quiet before fast forwarding
+    quiet_s: float = 1.0
+    # How often to recheck the derivative while fast forwarding
+    recheck_s: float = 1.0
+    # End a segment when its position error bound reaches this
+    max_position_error_m: float = 1.0
+
+
+@dataclass
+class Segment:
+    t_start_s: float
+    duration_s: float
+    velocity_error_m_s: float
+    attitude_error_rad: float
+    rate_error_rad_s: float
+    position_error_m: float
+
+
+class FastForward:
+    """
+    Steps one aircraft like solver.step, fast forwarding through quiet segments.
+
+    ff = fast_forward.FastForward(coeffs, props)
+    # then every step: state = ff.step(dt, state, wind_ned, gust_b, t=t)
+    print(ff.report())
+    """
+
+    def __init__(
+        self,
+        coeffs: AircraftCoeffs,
+        props: AircraftPhysicalProperties,
+        thresholds: Thresholds = Thresholds(),
+    ):
+        self.coeffs = coeffs
+        self.props = props
+        self.thresholds = thresholds
+
+        self.active = False
+        self.segments: list[Segment] = []
+        self.total_s = 0.0
+        self.fast_forwarded_s = 0.0
+
+        self._inputs = None
+        self._quiet_s = 0.0
+        self._since_check_s = 0.0
+        self._Pdot = None
+        self._speed = 0.0
+
+    def is_quiet(self, xdot) -> bool:
+        """
+        Whether a state derivative is below every threshold.
+        """
+        th = self.thresholds
+        return (
+            np.max(np.abs(xdot[6:9])) < th.accel_m_s2
+            and np.max(np.abs(xdot[9:12])) < th.ang_accel_rad_s2
+            and np.max(np.abs(xdot[3:6])) < th.rate_rad_s
+        )
+
+    def step(
+        self,
+        dt: float,
+        state: AircraftState,
+        wind_ned=None,
+        gust_b=None,
+        t: float | None = None,
+        next_input_t: float | None = None,
+    ) -> AircraftState:
+        """
+        Take one step, same as solver.step(dt, state, coeffs, props, wind_ned, gust_b).
+        Returns new state.
+
+        If the time of the next scheduled control change is known, pass it as next_input_t
+        (with the current time t) and no fast forward segment will be started shorter than
+        quiet_s before it.
+        """
+        inputs = self._input_key(state, wind_ned, gust_b)
+        if inputs != self._inputs:
+            # Control or disturbance change - back to full integration
+            self._inputs = inputs
+            self._quiet_s = 0.0
+            self._end_segment()
+
+        xdot = None
+        if self.active:
+            self._since_check_s += dt
+            if self._since_check_s >= self.thresholds.recheck_s:
+                self._since_check_s = 0.0
+                xdot = solver.dxdt(state, self.coeffs, self.props, wind_ned, gust_b)
+                if not self.is_quiet(xdot):
+                    self._quiet_s = 0.0
+                    self._end_segment()
+
+        if self.active:
+            # Velocities and attitude held, position moves in a straight line
+            state.x_m += self._Pdot[0] * dt
+            state.y_m += self._Pdot[1] * dt
+            state.altitude_m -= self._Pdot[2] * dt
+
+            segment = self.segments[-1]
+            self._grow(segment, dt)
+            self.total_s += dt
+            self.fast_forwarded_s += dt
+            if segment.position_error_m >= self.thresholds.max_position_error_m:
+                self._quiet_s = 0.0
+                self._end_segment()
+            return state
+
+        if xdot is None:
+            xdot = solver.dxdt(state, self.coeffs, self.props, wind_ned, gust_b)
+
+        if self.is_quiet(xdot):
+            self._quiet_s += dt
+        else:
+            self._quiet_s = 0.0
+
+        input_due = (
+            t is not None
+            and next_input_t is not None
+            and next_input_t - t < self.thresholds.quiet_s
+        )
+        if self._quiet_s >= self.thresholds.quiet_s and not input_due:
+            self._start_segment(xdot)
+
+        self.total_s += dt
+        return solver.euler_step(dt, state, xdot)
+
+    def report(self) -> dict:
+        """
+        How much simulated time was fast forwarded, and the worst error bounds of any segment.
+        """
+
+        def worst(name):
+            return max((getattr(s, name) for s in self.segments), default=0.0)
+
+        return {
+            "total_s": self.total_s,
+            "fast_forwarded_s": self.fast_forwarded_s,
+            "fraction": self.fast_forwarded_s / self.total_s if self.total_s else 0.0,
+            "segments": len(self.segments),
+            "thresholds": self.thresholds,
+            "velocity_error_m_s": worst("velocity_error_m_s"),
+            "attitude_error_rad": worst("attitude_error_rad"),
+            "rate_error_rad_s": worst("rate_error_rad_s"),
+            "position_error_m": worst("position_error_m"),
+        }
+
+    def _input_key(self, state: AircraftState, wind_ned, gust_b) -> tuple:
+        key = (state.de_rad, state.da_rad, state.dr_rad, state.thrust_N)
+        if wind_ned is not None:
+            key += tuple(np.ravel(wind_ned))
+        if gust_b is not None:
+            key += tuple(np.ravel(gust_b))
+        return key
+
+    def _start_segment(self, xdot):
+        self.active = True
+        self._since_check_s = 0.0
+        self._Pdot = np.array(xdot[0:3])
+        self._speed = float(np.linalg.norm(self._Pdot))
+        self.segments.append(Segment(self.total_s, 0.0, 0.0, 0.0, 0.0, 0.0))
+
+    def _end_segment(self):
+        self.active = False
+
+    def _grow(self, segment: Segment, dt: float):
+        th = self.thresholds
+        tau = segment.duration_s + dt
+        segment.duration_s = tau
+        segment.velocity_error_m_s = th.accel_m_s2 * tau
+        segment.attitude_error_rad = th.rate_rad_s * tau
+        segment.rate_error_rad_s = th.ang_accel_rad_s2 * tau
+        segment.position_error_m = (
+            0.5 * (th.accel_m_s2 + self._speed * th.rate_rad_s) * tau**2
+        )
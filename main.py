@@ -26,6 +26,7 @@ import cessnalike_aircraft
 import B737
 import solver
 import trimmer
+import wind
 from aircraft import AircraftState
 
 RAD2DEG = 180 / np.pi
@@ -83,6 +84,14 @@ def run_sim():
     # To preserve trim state for reference, we'll make a copy to use for simulation
     state = copy.deepcopy(trimmed_state)
 
+    # Wind - calm by default. For example, a 10 m/s wind from the north with moderate turbulence:
+    # wind_model = wind.WindModel(
+    #     wind.SteadyWind(speed_m_s=10),
+    #     wind.Turbulence(wind.W20_MODERATE_M_S, altitude_m_trim, tas_m_s_trim, dt=0.01, duration_s=60),
+    # )
+    # wind.ground_relative(state, wind_model.steady.ned(altitude_m_trim))  # start trimmed in the wind
+    wind_model = wind.WindModel()
+
     # Simulation
     dt = 0.01
     T = 60
@@ -99,7 +108,10 @@ def run_sim():
             state.de_rad = trimmed_state.de_rad
 
         # Step simulation forward
-        state = solver.step(dt, state, cessna_coeffs, cessna_properties)
+        wind_ned, gust_b = wind_model.sample(t, state.altitude_m)
+        state = solver.step(
+            dt, state, cessna_coeffs, cessna_properties, wind_ned, gust_b
+        )
         t += dt
 
 
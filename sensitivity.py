@@ -0,0 +1,194 @@
+"""
+Sensitivity of a manoeuvre response to each of the stability and control derivatives.
+
+Every perturbed coefficient set is built up front and the whole lot is simulated as one
+batch with batch_solver (the AircraftCoeffs fields just become arrays), so the cost is
+close to one batched run rather than one run per perturbation.
+
+Two ways of getting the derivatives:
+- "central": central differences, 2 runs per coefficient plus the nominal run.
+- "complex": complex step, 1 run per coefficient. The coefficient gets a tiny imaginary
+  step and the derivative is the imaginary part of the response divided by the step.
+  No subtractive cancellation, so it's accurate to machine precision.
+"""
+
+from dataclasses import dataclass, fields
+
+import numpy as np
+
+import batch_solver
+import trimmer
+from aircraft import AircraftCoeffs, AircraftPhysicalProperties
+
+DEG2RAD = np.pi / 180
+
+COEFF_NAMES = tuple(f.name for f in fields(AircraftCoeffs))
+OUTPUTS = (
+    "u_m_s",
+    "v_m_s",
+    "w_m_s",
+    "p_rad_s",
+    "q_rad_s",
+    "r_rad_s",
+    "phi_rad",
+    "tht_rad",
+    "psi_rad",
+    "altitude_m",
+)
+
+# Order of the columns in a controls schedule. Same column order as shared_results, but
+# here the schedule is deviations from trim, while shared_results takes absolute values -
+# add the trim controls before passing one of these schedules to shared_results.
+CONTROLS = ("de_rad", "da_rad", "dr_rad", "thrust_N")
+
+
+def elevator_pulse(
+    T: float,
+    dt: float,
+    amplitude_rad: float = -2 * DEG2RAD,
+    start_s: float = 10.0,
+    end_s: float = 12.0,
+) -> np.ndarray:
+    """
+    Control deviations from trim for the elevator pulse in main.run_sim, shape (n_steps, 4).
+    """
+    t = np.arange(int(round(T / dt)) + 1) * dt
+    controls = np.zeros((len(t), len(CONTROLS)))
+    controls[(t >= start_s) & (t <= end_s), 0] = amplitude_rad
+    return controls
+
+
+@dataclass
+class SensitivityResult:
+    coeffs: tuple[str, ...]
+    outputs: tuple[str, ...]
+    t: np.ndarray  # (n_steps,)
+    nominal: np.ndarray  # (n_outputs, n_steps), nominal response
+
+    # Normalised sensitivities, (n_outputs, n_coeffs, n_steps): change in each output, as a
+    # fraction of the RMS of its nominal response, for a 100% change in each coefficient
+    S: np.ndarray
+
+    # RMS over time of S, (n_outputs, n_coeffs)
+    summary: np.ndarray
+
+    def ranked(self, output: str | None = None) -> list[tuple[str, float]]:
+        """
+        Coefficients sorted by how much they matter, most important first. For one output,
+        or averaged over every output if output is None.
+        """
+        if output is None:
+            score = np.nanmean(self.summary, axis=0)
+        else:
+            score = self.summary[self.outputs.index(output)]
+        order = np.argsort(-score)
+        return [(self.coeffs[j], float(score[j])) for j in order]
+
+
+def _batch_coeffs(coeffs: AircraftCoeffs, values: np.ndarray) -> AircraftCoeffs:
+    # AircraftCoeffs with a (n_runs,) array for every field, values shaped (n_coeffs, n_runs)
+    return AircraftCoeffs(**{name: values[j] for j, name in enumerate(COEFF_NAMES)})
+
+
+def run(
+    props: AircraftPhysicalProperties,
+    coeffs: AircraftCoeffs,
+    altitude_m: float,
+    tas_m_s: float,
+    fpa_rad: float,
+    controls: np.ndarray,
+    dt: float = 0.01,
+    method: str = "complex",
+    rel_step: float = 1e-3,
+    c_floor: float = 0.01,
+    retrim: bool = False,
+    outputs: tuple[str, ...] = OUTPUTS,
+) -> SensitivityResult:
+    """
+    Simulate the manoeuvre given by controls (deviations from trim, shaped (n_steps, 4) in
+    CONTROLS order) for every perturbed coefficient set at once, and return the sensitivities.
+
+    Coefficients are stepped by rel_step of their value. Coefficients that are zero are
+    treated as if their value was c_floor, both for the step size and the normalisation.
+
+    By default every run starts from the nominal trim, so a coefficient that upsets the trim
+    (like Cm_0) shows up through the drift away from it. With retrim=True each perturbed set is
+    trimmed on its own first, so only the change in the manoeuvre response itself is measured.
+    The trimmer isn't complex-step friendly, so this only works with method="central".
+    """
+    c0 = np.array([getattr(coeffs, name) for name in COEFF_NAMES], dtype=float)
+    c_ref = np.maximum(np.abs(c0), c_floor)
+    n_coeffs = len(COEFF_NAMES)
+
+    if method == "central":
+        h = rel_step * c_ref
+        # Run 0 is nominal, then +h and -h for each coefficient
+        n_runs = 1 + 2 * n_coeffs
+        values = np.repeat(c0[:, None], n_runs, axis=1)
+        values[np.arange(n_coeffs), 1 + 2 * np.arange(n_coeffs)] += h
+        values[np.arange(n_coeffs), 2 + 2 * np.arange(n_coeffs)] -= h
+        dtype = float
+    elif method == "complex":
+        if retrim:
+            raise ValueError("retrim only works with method='central'")
+        h = 1e-20 * c_ref
+        # Run j steps coefficient j, the nominal response is the real part of any run
+        n_runs = n_coeffs
+        values = np.repeat(c0[:, None], n_runs, axis=1).astype(complex)
+        values[np.arange(n_coeffs), np.arange(n_coeffs)] += 1j * h
+        dtype = complex
+    else:
+        raise ValueError(f"Unknown method '{method}', use 'central' or 'complex'")
+
+    batch_coeffs = _batch_coeffs(coeffs, values)
+
+    if retrim:
+        trimmed = [
+            trimmer.trim(
+                altitude_m,
+                tas_m_s,
+                fpa_rad,
+                props,
+                _batch_coeffs(coeffs, values[:, k].real),
+            )
+            for k in range(n_runs)
+        ]
+        state = batch_solver.stack(trimmed, dtype)
+    else:
+        trimmed_state = trimmer.trim(altitude_m, tas_m_s, fpa_rad, props, coeffs)
+        state = batch_solver.repeat(trimmed_state, n_runs, dtype)
+
+    trim_controls = [getattr(state, name).copy() for name in CONTROLS]
+    n_steps = len(controls)
+    y = np.empty((len(outputs), n_runs, n_steps), dtype=dtype)
+
+    for i in range(n_steps):
+        for k, name in enumerate(CONTROLS):
+            setattr(state, name, trim_controls[k] + controls[i, k])
+
+        for j, name in enumerate(outputs):
+            y[j, :, i] = getattr(state, name)
+
+        state = batch_solver.step(dt, state, batch_coeffs, props)
+
+    if method == "central":
+        nominal = y[:, 0, :]
+        dy_dc = (y[:, 1::2, :] - y[:, 2::2, :]) / (2 * h[None, :, None])
+    else:
+        nominal = y[:, 0, :].real
+        dy_dc = y.imag / h[None, :, None]
+
+    # Normalise by the size of each output's nominal response about its starting value
+    y_ref = np.sqrt(np.mean((nominal - nominal[:, :1]) ** 2, axis=-1))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        S = dy_dc * c_ref[None, :, None] / y_ref[:, None, None]
+    S[y_ref < 1e-9] = np.nan  # outputs the manoeuvre doesn't move at all
+
+    return SensitivityResult(
+        coeffs=COEFF_NAMES,
+        outputs=tuple(outputs),
+        t=np.arange(n_steps) * dt,
+        nominal=np.real(nominal),
+        S=np.real(S),
+        summary=np.sqrt(np.mean(np.real(S) ** 2, axis=-1)),
+    )
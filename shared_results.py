@@ -0,0 +1,307 @@
+"""
+Shared-memory result transport for running many trajectories in worker processes.
+
+Pickling full state histories back from worker processes can cost about as much as
+running the simulation itself. Instead, the parent preallocates one shared memory
+block big enough for every run, workers write their recorded channels straight into
+it as they simulate, and the parent reads the results as NumPy views with no copy.
+"""
+
+import sys
+import weakref
+from concurrent.futures import Executor, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+import solver
+from aircraft import AircraftState, AircraftCoeffs, AircraftPhysicalProperties
+
+RAD2DEG = 180 / np.pi
+
+# Recorded channels, in the same order and units as main.log_state
+CHANNELS = (
+    "t",
+    "x",
+    "y",
+    "alt",
+    "phi",
+    "tht",
+    "psi",
+    "u",
+    "v",
+    "w",
+    "p",
+    "q",
+    "r",
+    "de",
+    "da",
+    "dr",
+    "thrust",
+)
+CHANNEL_INDEX = {name: i for i, name in enumerate(CHANNELS)}
+
+
+@dataclass(frozen=True)
+class SharedHistorySpec:
+    """
+    Everything a worker needs to attach to a block. Small and cheap to pickle.
+    """
+
+    name: str
+    n_runs: int
+    n_steps: int
+
+
+def _nbytes(n_runs: int, n_steps: int) -> int:
+    # float64 channel data followed by one int64 step counter per run
+    return 8 * n_runs * len(CHANNELS) * n_steps + 8 * n_runs
+
+
+def _attach_untracked(name: str) -> shared_memory.SharedMemory:
+    """
+    Attach to an existing block without registering it with this process's resource
+    tracker. Workers don't own the block, and a worker's tracker would otherwise unlink it
+    when the worker exits. Unregistering after attaching isn't safe either: a worker usually
+    shares the parent's tracker, so that would drop the parent's registration too.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+def _release(shm: shared_memory.SharedMemory, owner: bool):
+    """
+    Unlink (if we own the block) and close it. Unlinking goes first so the name is always
+    removed from the system even if someone is still holding views into the memory - the
+    mapping then just lives on until those views are garbage collected.
+    """
+    if owner:
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+    try:
+        shm.close()
+    except BufferError:
+        pass
+
+
+class SharedHistory:
+    """
+    A block of recorded state histories, shape (n_runs, n_channels, n_steps), living in shared memory.
+
+    Create it in the parent with SharedHistory.create(), hand `spec` to workers, and workers
+    use SharedHistory.attach(spec) to write into it. The parent owns the block and is the
+    only one that unlinks it. That happens on close(), when leaving a `with` block, when the
+    object is garbage collected, or at interpreter exit - whichever comes first. If the parent
+    is killed outright, multiprocessing's resource tracker cleans up the block instead.
+    """
+
+    def __init__(
+        self, shm: shared_memory.SharedMemory, spec: SharedHistorySpec, owner: bool
+    ):
+        self.spec = spec
+        self._shm = shm
+        self._finalizer = weakref.finalize(self, _release, shm, owner)
+
+        n_data = spec.n_runs * len(CHANNELS) * spec.n_steps
+        self.data = np.ndarray(
+            (spec.n_runs, len(CHANNELS), spec.n_steps), dtype=np.float64, buffer=shm.buf
+        )
+        # Number of steps each run has written, so partial runs can be spotted after a crash
+        self.steps_written = np.ndarray(
+            (spec.n_runs,), dtype=np.int64, buffer=shm.buf, offset=8 * n_data
+        )
+
+    @classmethod
+    def create(cls, n_runs: int, n_steps: int) -> "SharedHistory":
+        shm = shared_memory.SharedMemory(create=True, size=_nbytes(n_runs, n_steps))
+        history = cls(shm, SharedHistorySpec(shm.name, n_runs, n_steps), owner=True)
+        history.steps_written[:] = 0
+        return history
+
+    @classmethod
+    def attach(cls, spec: SharedHistorySpec) -> "SharedHistory":
+        return cls(_attach_untracked(spec.name), spec, owner=False)
+
+    def channel(self, name: str) -> np.ndarray:
+        """
+        View of one channel for every run, shape (n_runs, n_steps).
+        """
+        return self.data[:, CHANNEL_INDEX[name], :]
+
+    def complete(self) -> np.ndarray:
+        """
+        Boolean mask of runs that wrote every step.
+        """
+        return self.steps_written == self.spec.n_steps
+
+    def close(self):
+        # Drop our own views first so the memory can actually be closed
+        self.data = None
+        self.steps_written = None
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def record(buf: np.ndarray, i: int, t: float, state: AircraftState):
+    """
+    Write one sample into column i of a (n_channels, n_steps) buffer. Same as main.log_state.
+    """
+    buf[:, i] = (
+        t,
+        state.x_m,
+        state.y_m,
+        state.altitude_m,
+        state.phi_rad * RAD2DEG,
+        state.tht_rad * RAD2DEG,
+        state.psi_rad * RAD2DEG,
+        state.u_m_s,
+        state.v_m_s,
+        state.w_m_s,
+        state.p_rad_s * RAD2DEG,
+        state.q_rad_s * RAD2DEG,
+        state.r_rad_s * RAD2DEG,
+        state.de_rad * RAD2DEG,
+        state.da_rad * RAD2DEG,
+        state.dr_rad * RAD2DEG,
+        state.thrust_N,
+    )
+
+
+def _simulate(
+    buf: np.ndarray,
+    steps_written: np.ndarray,
+    state: AircraftState,
+    coeffs: AircraftCoeffs,
+    props: AircraftPhysicalProperties,
+    dt: float,
+    controls: np.ndarray | None,
+):
+    """
+    The simulation loop from main.run_sim, recording into buf instead of lists.
+    controls is an optional (n_steps, 4) schedule of [de_rad, da_rad, dr_rad, thrust_N].
+    """
+    for i in range(buf.shape[1]):
+        if controls is not None:
+            state.de_rad, state.da_rad, state.dr_rad, state.thrust_N = controls[i]
+
+        record(buf, i, i * dt, state)
+        steps_written[...] = i + 1
+
+        state = solver.step(dt, state, coeffs, props)
+
+
+def simulate_into(
+    spec: SharedHistorySpec,
+    run: int,
+    state: AircraftState,
+    coeffs: AircraftCoeffs,
+    props: AircraftPhysicalProperties,
+    dt: float,
+    controls: np.ndarray | None = None,
+):
+    """
+    Worker entry point: simulate one run and write it into row `run` of the shared block.
+    """
+    history = SharedHistory.attach(spec)
+    try:
+        _simulate(
+            history.data[run],
+            history.steps_written[run : run + 1],
+            state,
+            coeffs,
+            props,
+            dt,
+            controls,
+        )
+    finally:
+        history.close()
+
+
+def simulate_pickled(
+    n_steps: int,
+    state: AircraftState,
+    coeffs: AircraftCoeffs,
+    props: AircraftPhysicalProperties,
+    dt: float,
+    controls: np.ndarray | None = None,
+) -> np.ndarray:
+    """
+    Worker entry point that returns the (n_channels, n_steps) history the usual way, by pickling.
+    Mostly here as a baseline to compare against.
+    """
+    buf = np.empty((len(CHANNELS), n_steps))
+    _simulate(buf, np.zeros(()), state, coeffs, props, dt, controls)
+    return buf
+
+
+def run_batch(
+    states: list[AircraftState],
+    coeffs: AircraftCoeffs,
+    props: AircraftPhysicalProperties,
+    dt: float,
+    T: float,
+    controls: np.ndarray | None = None,
+    pool: Executor | None = None,
+) -> SharedHistory:
+    """
+    Simulate each initial state for T seconds in a process pool and return the shared history.
+    controls, if given, is shaped (n_runs, n_steps, 4). Pass an existing pool to reuse its
+    workers, otherwise a ProcessPoolExecutor is created just for this batch.
+
+    The caller owns the returned block, so use it as a context manager or call close()
+    once finished with the results. Copy anything that needs to outlive it.
+    """
+    n_steps = int(round(T / dt)) + 1
+    history = SharedHistory.create(len(states), n_steps)
+    own_pool = pool is None
+    if own_pool:
+        pool = ProcessPoolExecutor()
+
+    futures = []
+    try:
+        for run, state in enumerate(states):
+            futures.append(
+                pool.submit(
+                    simulate_into,
+                    history.spec,
+                    run,
+                    state,
+                    coeffs,
+                    props,
+                    dt,
+                    None if controls is None else controls[run],
+                )
+            )
+        for future in futures:
+            future.result()
+    except BaseException:
+        # A worker died or raised - don't leave the block lying around. Cancel what hasn't
+        # started and wait for the rest first, so no worker attaches after it's unlinked
+        if own_pool:
+            pool.shutdown(wait=True, cancel_futures=True)
+        else:
+            for future in futures:
+                future.cancel()
+            wait(futures)
+        history.close()
+        raise
+    finally:
+        if own_pool:
+            pool.shutdown(cancel_futures=True)
+
+    return history
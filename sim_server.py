@@ -0,0 +1,485 @@
+"""
+Simulation server for hosting many interactive sessions in one process.
+
+Clients connect over a local TCP socket and talk newline-delimited JSON. Each message is
+an object with an "op" and optionally an "id", which is echoed back in the reply:
+
+    {"op": "create", "aircraft": "b737", "altitude_m": 1524, "tas_m_s": 100, "fpa_rad": 0}
+        -> {"op": "created", "session": 1, "state": {...}}
+    {"op": "controls", "session": 1, "de_rad": -0.1, "thrust_N": 12000}
+        -> {"op": "ok"}  (any of de_rad, da_rad, dr_rad, thrust_N, applied on the next tick)
+    {"op": "subscribe", "session": 1, "every": 10}
+        -> {"op": "ok"}, then {"op": "state", "session": 1, "t": ..., ...} every 10 ticks
+    {"op": "unsubscribe", "session": 1}  -> {"op": "ok"}
+    {"op": "metrics", "session": 1}      -> {"op": "metrics", ...}
+    {"op": "close", "session": 1}        -> {"op": "ok"}
+
+Errors come back as {"op": "error", "message": ...}. NaN and inf aren't valid JSON, so a
+message that would contain them (e.g. the state of a session that has diverged) is sent as
+an error instead. Sessions belong to the connection that created them and are closed when
+it disconnects.
+
+Rather than each session running its own loop, every tick gathers all the sessions and
+advances them with a single batch_solver.step call. The coefficients and physical
+properties are stored per session as arrays, so different aircraft share the same batch.
+
+Slow subscribers can't hold up the tick: each connection has a bounded buffer of state
+messages and its own writer task. If a client can't keep up, the oldest buffered states
+are dropped (and counted) so it always gets the most recent ones.
+"""
+
+import asyncio
+import collections
+import json
+import math
+import time
+from dataclasses import fields
+
+import numpy as np
+
+import B737
+import batch_solver
+import cessnalike_aircraft
+import trimmer
+from aircraft import AircraftState, AircraftCoeffs, AircraftPhysicalProperties
+
+AIRCRAFT = {
+    "b737": B737.get_737_500_info,
+    "cessna": cessnalike_aircraft.get_cessna_info,
+}
+
+CONTROLS = ("de_rad", "da_rad", "dr_rad", "thrust_N")
+COEFF_FIELDS = tuple(f.name for f in fields(AircraftCoeffs))
+PROP_FIELDS = tuple(f.name for f in fields(AircraftPhysicalProperties))
+
+
+class LatencyStats:
+    """
+    Running latency statistics, keeping the most recent samples for percentiles.
+    """
+
+    def __init__(self, n_recent: int = 1000):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = collections.deque(maxlen=n_recent)
+
+    def record(self, latency_s: float):
+        self.count += 1
+        self.total += latency_s
+        self.max = max(self.max, latency_s)
+        self.recent.append(latency_s)
+
+    def summary(self) -> dict:
+        if self.count == 0:
+            return {"count": 0}
+        recent = np.array(self.recent)
+        return {
+            "count": self.count,
+            "mean_ms": 1e3 * self.total / self.count,
+            "p50_ms": 1e3 * float(np.percentile(recent, 50)),
+            "p99_ms": 1e3 * float(np.percentile(recent, 99)),
+            "max_ms": 1e3 * self.max,
+        }
+
+
+class Session:
+    def __init__(self, session_id: int, aircraft: str, connection: "Connection"):
+        self.id = session_id
+        self.aircraft = aircraft
+        self.connection = connection
+        self.ticks = 0
+        self.every = 0  # publish every this many ticks, 0 = not subscribed
+
+        # Control inputs waiting for the next tick, and when they arrived
+        self.pending = {}
+        self.pending_since = None
+
+        self.input_latency = LatencyStats()  # control received -> applied by a tick
+        self.publish_latency = LatencyStats()  # tick -> state written to the socket
+        self.dropped = 0
+
+    def metrics(self) -> dict:
+        return {
+            "session": self.id,
+            "ticks": self.ticks,
+            "input_latency": self.input_latency.summary(),
+            "publish_latency": self.publish_latency.summary(),
+            "dropped": self.dropped,
+        }
+
+
+class Connection:
+    """
+    One client. Replies are never dropped, state messages go through a bounded buffer.
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter, max_buffered: int):
+        self.writer = writer
+        self.replies = collections.deque()
+        self.states = collections.deque(maxlen=max_buffered)
+        self.wakeup = asyncio.Event()
+        self.sessions = set()
+
+    def reply(self, message: dict):
+        self.replies.append(message)
+        self.wakeup.set()
+
+    def publish(self, session: Session, message: dict, tick_time: float):
+        if len(self.states) == self.states.maxlen:
+            dropped_session, _, _ = self.states[0]
+            dropped_session.dropped += 1
+        self.states.append((session, message, tick_time))
+        self.wakeup.set()
+
+    async def send_loop(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+
+            while self.replies:
+                self.writer.write(_encode_checked(self.replies.popleft()))
+                await self.writer.drain()
+
+            while self.states and not self.replies:
+                session, message, tick_time = self.states.popleft()
+                self.writer.write(_encode_checked(message))
+                await self.writer.drain()
+                session.publish_latency.record(time.perf_counter() - tick_time)
+
+
+def _encode(message: dict) -> bytes:
+    return (json.dumps(message, allow_nan=False) + "\n").encode()
+
+
+def _encode_checked(message: dict) -> bytes:
+    """
+    Encode a message, or an error in its place if it has NaN or inf in it (e.g. from a
+    session that has diverged), since those aren't valid JSON.
+    """
+    try:
+        return _encode(message)
+    except ValueError:
+        error = {"op": "error", "message": f"'{message['op']}' has non-finite values"}
+        for key in ("id", "session"):
+            if key in message:
+                error[key] = message[key]
+        return _encode(error)
+
+
+def _number(message: dict, name: str, default: float | None = None) -> float:
+    value = float(message.get(name, default))
+    if not math.isfinite(value):
+        raise ValueError(f"{name} must be finite")
+    return value
+
+
+class SimServer:
+    """
+    Hosts the sessions and runs the shared tick loop.
+
+    With realtime=True each tick is paced to dt of wall clock time, otherwise the ticks run
+    as fast as possible (still yielding to the event loop between them).
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        dt: float = 0.01,
+        realtime: bool = True,
+        max_buffered: int = 64,
+    ):
+        self.host = host
+        self.port = port
+        self.dt = dt
+        self.realtime = realtime
+        self.max_buffered = max_buffered
+
+        self.sessions: list[Session] = []  # in the same order as the batch arrays
+        self.tick_time = LatencyStats()  # how long each batched tick takes to compute
+        self._next_id = 1
+
+        # Batch of every session's state, coefficients and properties
+        self.state = batch_solver.stack([])
+        self.coeffs = AircraftCoeffs(**{f: np.zeros(0) for f in COEFF_FIELDS})
+        self.props = AircraftPhysicalProperties(**{f: np.zeros(0) for f in PROP_FIELDS})
+
+        self._server = None
+        self._tick_task = None
+        self._handlers = {}  # Connection -> the task handling it
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._tick_task = asyncio.create_task(self._tick_loop())
+
+    async def stop(self):
+        self._tick_task.cancel()
+        self._server.close()
+
+        # Hang up on every client and let their handlers clean up. Abort rather than close,
+        # a slow client's unsent data would otherwise keep the connection open
+        handlers = list(self._handlers.values())
+        for connection in list(self._handlers):
+            connection.writer.transport.abort()
+        await asyncio.gather(self._tick_task, *handlers, return_exceptions=True)
+        await self._server.wait_closed()
+
+    async def serve_forever(self):
+        await self.start()
+        await self._server.serve_forever()
+
+    # --- Batch bookkeeping ---
+
+    def _add(self, session: Session, state: AircraftState, coeffs, props):
+        for batch, single, names in (
+            (self.state, state, batch_solver.STATE_FIELDS),
+            (self.coeffs, coeffs, COEFF_FIELDS),
+            (self.props, props, PROP_FIELDS),
+        ):
+            for name in names:
+                setattr(
+                    batch, name, np.append(getattr(batch, name), getattr(single, name))
+                )
+        self.sessions.append(session)
+
+    def _remove(self, session: Session):
+        i = self.sessions.index(session)
+        for batch, names in (
+            (self.state, batch_solver.STATE_FIELDS),
+            (self.coeffs, COEFF_FIELDS),
+            (self.props, PROP_FIELDS),
+        ):
+            for name in names:
+                setattr(batch, name, np.delete(getattr(batch, name), i))
+        del self.sessions[i]
+
+    def _state_dict(self, i: int) -> dict:
+        return {
+            name: float(getattr(self.state, name)[i])
+            for name in batch_solver.STATE_FIELDS
+        }
+
+    # --- Tick loop ---
+
+    async def _tick_loop(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while True:
+            self._tick()
+
+            if self.realtime:
+                next_tick += self.dt
+                await asyncio.sleep(max(0.0, next_tick - loop.time()))
+            else:
+                await asyncio.sleep(0)
+
+    def _tick(self):
+        if not self.sessions:
+            return
+        start = time.perf_counter()
+
+        # Apply any control inputs that came in since the last tick
+        for i, session in enumerate(self.sessions):
+            if session.pending:
+                for name, value in session.pending.items():
+                    getattr(self.state, name)[i] = value
+                session.input_latency.record(start - session.pending_since)
+                session.pending = {}
+
+        # Every session, one step
+        self.state = batch_solver.step(self.dt, self.state, self.coeffs, self.props)
+
+        for i, session in enumerate(self.sessions):
+            session.ticks += 1
+            if session.every and session.ticks % session.every == 0:
+                message = {
+                    "op": "state",
+                    "session": session.id,
+                    "t": session.ticks * self.dt,
+                }
+                message.update(self._state_dict(i))
+                session.connection.publish(session, message, start)
+
+        self.tick_time.record(time.perf_counter() - start)
+
+    # --- Client handling ---
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        connection = Connection(writer, self.max_buffered)
+        self._handlers[connection] = asyncio.current_task()
+        sender = asyncio.create_task(connection.send_loop())
+        try:
+            while line := await reader.readline():
+                message = {}
+                try:
+                    message = json.loads(line)
+                    reply = await self._dispatch(connection, message)
+                except (ValueError, KeyError, TypeError, AttributeError) as e:
+                    reply = {"op": "error", "message": str(e)}
+                if isinstance(message, dict) and "id" in message:
+                    reply["id"] = message["id"]
+                connection.reply(reply)
+        except ConnectionError:
+            pass
+        finally:
+            for session in list(connection.sessions):
+                self._remove(session)
+            sender.cancel()
+            writer.close()
+            del self._handlers[connection]
+
+    def _session(self, connection: Connection, message: dict) -> Session:
+        session_id = message["session"]
+        for session in connection.sessions:
+            if session.id == session_id:
+                return session
+        raise KeyError(f"no session {session_id} on this connection")
+
+    async def _dispatch(self, connection: Connection, message: dict) -> dict:
+        op = message.get("op")
+
+        if op == "create":
+            aircraft = message.get("aircraft", "b737")
+            if aircraft not in AIRCRAFT:
+                raise ValueError(
+                    f"unknown aircraft '{aircraft}', use one of {list(AIRCRAFT)}"
+                )
+            props, coeffs = AIRCRAFT[aircraft]()
+
+            altitude_m = _number(message, "altitude_m", 1524)
+            tas_m_s = _number(message, "tas_m_s", 100)
+            fpa_rad = _number(message, "fpa_rad", 0.0)
+            if tas_m_s <= 0:
+                raise ValueError("tas_m_s must be positive")
+
+            # Trimming takes a while, don't hold up the ticks for it
+            state = await asyncio.get_running_loop().run_in_executor(
+                None,
+                trimmer.trim,
+                altitude_m,
+                tas_m_s,
+                fpa_rad,
+                props,
+                coeffs,
+            )
+
+            session = Session(self._next_id, aircraft, connection)
+            self._next_id += 1
+            self._add(session, state, coeffs, props)
+            connection.sessions.add(session)
+            return {
+                "op": "created",
+                "session": session.id,
+                "state": self._state_dict(len(self.sessions) - 1),
+            }
+
+        if op == "controls":
+            session = self._session(connection, message)
+            if not session.pending:
+                session.pending_since = time.perf_counter()
+            for name in CONTROLS:
+                if name in message:
+                    session.pending[name] = _number(message, name)
+            return {"op": "ok"}
+
+        if op == "subscribe":
+            session = self._session(connection, message)
+            session.every = max(1, int(message.get("every", 1)))
+            return {"op": "ok"}
+
+        if op == "unsubscribe":
+            self._session(connection, message).every = 0
+            return {"op": "ok"}
+
+        if op == "metrics":
+            reply = {"op": "metrics"}
+            reply.update(self._session(connection, message).metrics())
+            reply["tick_time"] = self.tick_time.summary()
+            return reply
+
+        if op == "close":
+            session = self._session(connection, message)
+            self._remove(session)
+            connection.sessions.discard(session)
+            return {"op": "ok"}
+
+        raise ValueError(f"unknown op '{op}'")
+
+
+class SimClient:
+    """
+    Minimal asyncio client for the server, mostly for testing and as an example.
+    """
+
+    def __init__(self):
+        self.states = asyncio.Queue()
+        self.errors = []  # error replies the server couldn't match to a request
+        self._replies = {}
+        self._next_id = 1
+
+    async def connect(self, host: str, port: int):
+        self._reader, self._writer = await asyncio.open_connection(host, port)
+        self._read_task = asyncio.create_task(self._read_loop())
+
+    async def close(self):
+        self._read_task.cancel()
+        self._writer.close()
+
+    async def _read_loop(self):
+        try:
+            while line := await self._reader.readline():
+                message = json.loads(line)
+                if message.get("op") == "state":
+                    self.states.put_nowait(message)
+                    continue
+
+                reply = self._replies.pop(message.get("id"), None)
+                if reply is not None:
+                    reply.set_result(message)
+                else:
+                    # No id, e.g. an error for a line that wasn't valid JSON
+                    self.errors.append(message)
+        except ConnectionError:
+            pass  # server went away, same as end of stream
+        finally:
+            # Don't leave requests waiting on a reply that will never come
+            for reply in self._replies.values():
+                if not reply.done():
+                    reply.set_exception(ConnectionError("connection to server lost"))
+            self._replies.clear()
+
+    async def request(self, op: str, **kwargs) -> dict:
+        message = {"op": op, "id": self._next_id, **kwargs}
+        data = _encode(message)
+        self._next_id += 1
+        reply = asyncio.get_running_loop().create_future()
+        self._replies[message["id"]] = reply
+
+        self._writer.write(data)
+        await self._writer.drain()
+
+        reply = await reply
+        if reply["op"] == "error":
+            raise RuntimeError(reply["message"])
+        return reply
+
+    async def create(self, aircraft: str = "b737", **trim) -> int:
+        reply = await self.request("create", aircraft=aircraft, **trim)
+        return reply["session"]
+
+    async def controls(self, session: int, **controls):
+        await self.request("controls", session=session, **controls)
+
+    async def subscribe(self, session: int, every: int = 1):
+        await self.request("subscribe", session=session, every=every)
+
+    async def metrics(self, session: int) -> dict:
+        return await self.request("metrics", session=session)
+
+
+if __name__ == "__main__":
+    server = SimServer(port=8765)
+    print("Serving on 127.0.0.1:8765")
+    asyncio.run(server.serve_forever())
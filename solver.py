@@ -8,39 +8,55 @@ from aircraft import AircraftState, AircraftCoeffs, AircraftPhysicalProperties
 import calculate_forces_and_moments
 
 
-def dxdt(
-    state: AircraftState, coeffs: AircraftCoeffs, props: AircraftPhysicalProperties
-):
+def rotation_body_from_inertial(phi_rad, tht_rad, psi_rad):
     """
-    Calculate the state derivative based on the current state.
-    Note: I'm doing most of this in vector form because that's just nicer to work with.
-    The form of these equations is mostly in the body frame.
+    ZYX rotation matrix taking a vector from the inertial frame to the body frame.
     """
-    # Calculate forces/moments
-    FX, FY, FZ, Mx, My, Mz = calculate_forces_and_moments.calculate(
-        state, coeffs, props
-    )
-    F = np.array([FX, FY, FZ])
-    M = np.array([Mx, My, Mz])
+    c_phi = np.cos(phi_rad)
+    s_phi = np.sin(phi_rad)
+    c_tht = np.cos(tht_rad)
+    s_tht = np.sin(tht_rad)
+    c_psi = np.cos(psi_rad)
+    s_psi = np.sin(psi_rad)
 
-    # Calculate inertia matrix
-    I = np.array(
-        [[props.Ixx, 0, -props.Ixz], [0, props.Iyy, 0], [-props.Ixz, 0, props.Izz]]
+    return np.array(
+        [
+            [c_tht * c_psi, c_tht * s_psi, -s_tht],
+            [
+                s_phi * s_tht * c_psi - c_phi * s_psi,
+                c_phi * c_psi + s_phi * s_tht * s_psi,
+                s_phi * c_tht,
+            ],
+            [
+                s_phi * s_psi + c_phi * s_tht * c_psi,
+                -s_phi * c_psi + c_phi * s_tht * s_psi,
+                c_phi * c_tht,
+            ],
+        ]
     )
 
-    # Body frame velocity vector
-    v_b = np.array([state.u_m_s, state.v_m_s, state.w_m_s])
 
-    # Body frame angular velocity vector
-    w_b = np.array([state.p_rad_s, state.q_rad_s, state.r_rad_s])
+def dxdt(
+    state: AircraftState,
+    coeffs: AircraftCoeffs,
+    props: AircraftPhysicalProperties,
+    wind_ned=None,
+    gust_b=None,
+):
+    """
+    Calculate the state derivative based on the current state.
+    Note: I'm doing most of this in vector form because that's just nicer to work with.
+    The form of these equations is mostly in the body frame.
 
+    wind_ned is the wind velocity in the inertial frame and gust_b any turbulence in body axes
+    (see wind.py). The state velocities are always ground-relative; the wind only changes the
+    airspeed the forces are calculated from.
+    """
     # Kinematic ZYX orientation matrix
     c_phi = np.cos(state.phi_rad)
     s_phi = np.sin(state.phi_rad)
     c_tht = np.cos(state.tht_rad)
     s_tht = np.sin(state.tht_rad)
-    c_psi = np.cos(state.psi_rad)
-    s_psi = np.sin(state.psi_rad)
 
     R_kinematic = np.linalg.inv(
         np.array(
@@ -49,24 +65,38 @@ def dxdt(
     )
 
     # Body frame to inertial frame ZYX rotation matrix
-    R_bi = np.array(
-        [
-            [c_tht * c_psi, c_tht * s_psi, -s_tht],
-            [
-                s_phi * s_tht * c_psi - c_phi * s_psi,
-                c_phi * c_psi + s_phi * s_tht * s_psi,
-                s_phi * c_tht,
-            ],
-            [
-                s_phi * s_psi + c_phi * s_tht * c_psi,
-                -s_phi * c_psi + c_phi * s_tht * s_psi,
-                c_phi * c_tht,
-            ],
-        ]
+    R_bi = rotation_body_from_inertial(
+        state.phi_rad, state.tht_rad, state.psi_rad
     )  # to body, from inertial
     R_ib = np.linalg.inv(R_bi)  # to inertial, from body
 
+    # Wind in the body frame
+    wind_b = None
+    if wind_ned is not None:
+        wind_b = R_bi @ wind_ned
+    if gust_b is not None:
+        wind_b = gust_b if wind_b is None else wind_b + gust_b
+
+    # Calculate forces/moments
+    FX, FY, FZ, Mx, My, Mz = calculate_forces_and_moments.calculate(
+        state, coeffs, props, wind_b
+    )
+    F = np.array([FX, FY, FZ])
+    M = np.array([Mx, My, Mz])
+
+    # Calculate inertia matrix
+    I = np.array(
+        [[props.Ixx, 0, -props.Ixz], [0, props.Iyy, 0], [-props.Ixz, 0, props.Izz]]
+    )
+
+    # Body frame velocity vector (ground-relative)
+    v_b = np.array([state.u_m_s, state.v_m_s, state.w_m_s])
+
+    # Body frame angular velocity vector
+    w_b = np.array([state.p_rad_s, state.q_rad_s, state.r_rad_s])
+
     # Derivatives calculation
+    # Ground-relative, so the wind drifts the position
     Pdot = R_ib @ v_b  # position vector, where P = [x, y, z], z = -alt
     Omegadot = R_kinematic @ w_b  # orientation "vector", where Omega = [phi, tht, psi]
     vdot_b = 1 / props.mass * F - np.cross(w_b, v_b)
@@ -98,9 +128,22 @@ def step(
     state: AircraftState,
     coeffs: AircraftCoeffs,
     props: AircraftPhysicalProperties,
+    wind_ned=None,
+    gust_b=None,
 ):
     """
     Take an integration step based on current state and aircraft properties. Returns new state.
+    wind_ned and gust_b are optional wind and turbulence velocities, see dxdt.
+    """
+    # Calculate state derivative
+    xdot = dxdt(state, coeffs, props, wind_ned, gust_b)
+
+    return euler_step(dt, state, xdot)
+
+
+def euler_step(dt: float, state: AircraftState, xdot):
+    """
+    Advance state by dt with an already calculated state derivative. Returns new state.
     """
     # Old state in vector form - to be compatible with state derivative vector form
     x_old = np.array(
@@ -120,9 +163,6 @@ def step(
         ]
     )
 
-    # Calculate state derivative
-    xdot = dxdt(state, coeffs, props)
-
     # Euler integration step
     x_new = x_old + dt * xdot
 
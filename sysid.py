@@ -0,0 +1,246 @@
+"""
+Frequency sweep system identification of the non-linear model.
+
+Runs chirp or multisine inputs on one control surface around a trim point, for several
+input amplitudes at once using batch_solver, and estimates the frequency response and
+coherence from each control to each output. The idea is to get Bode plots that can be
+compared with the linear stability tool, and to see where (and at what amplitude) the
+non-linear model stops behaving linearly.
+
+The spectra are estimated with Welch's method, but computed as the simulation streams
+rather than from stored histories: each output only keeps one segment buffer, and the
+cross spectra are accumulated every time a segment fills up.
+"""
+
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+import numpy as np
+from scipy.signal import get_window
+
+import batch_solver
+import trimmer
+from aircraft import AircraftCoeffs, AircraftPhysicalProperties
+
+INPUTS = ("de_rad", "da_rad", "dr_rad")
+OUTPUTS = (
+    "u_m_s",
+    "v_m_s",
+    "w_m_s",
+    "p_rad_s",
+    "q_rad_s",
+    "r_rad_s",
+    "phi_rad",
+    "tht_rad",
+    "psi_rad",
+    "altitude_m",
+)
+
+
+def chirp(t: np.ndarray, f_min: float, f_max: float, T: float) -> np.ndarray:
+    """
+    Unit amplitude logarithmic frequency sweep from f_min to f_max [Hz] over T seconds.
+    """
+    k = np.log(f_max / f_min) / T
+    return np.sin(2 * np.pi * f_min * (np.exp(k * t) - 1) / k)
+
+
+def multisine(t: np.ndarray, f_min: float, f_max: float, period: float) -> np.ndarray:
+    """
+    Unit peak multisine with a component on every harmonic of 1/period in [f_min, f_max].
+    Uses Schroeder phases to keep the peak low for the amount of energy put in.
+    Choose period to match the analysis segment length so every component lands on a bin.
+    """
+    k = np.arange(np.ceil(f_min * period), np.floor(f_max * period) + 1)
+    phase = -np.pi * k * (k - 1) / len(k)
+
+    u = np.zeros_like(t, dtype=float)
+    for k_i, phase_i in zip(k, phase):
+        u += np.sin(2 * np.pi * k_i * t / period + phase_i)
+    return u / np.abs(u).max()
+
+
+class StreamingSpectra:
+    """
+    Welch auto and cross spectra between one input and several outputs, for a batch of runs,
+    accumulated one sample at a time. Uses a Hann window with 50% overlap, same as scipy's defaults.
+    Outputs the input doesn't excite at all (e.g. sideslip for elevator) come out as NaN.
+    """
+
+    def __init__(self, n_outputs: int, n_batch: int, nperseg: int):
+        self.nperseg = nperseg
+        self.hop = nperseg // 2
+        self.window = get_window("hann", nperseg)
+        self.n_segments = 0
+
+        # One buffer for the input and outputs together, input is row 0
+        self._buf = np.zeros((1 + n_outputs, n_batch, nperseg))
+        self._fill = 0
+
+        n_freq = nperseg // 2 + 1
+        self.Sxx = np.zeros((n_batch, n_freq))
+        self.Syy = np.zeros((n_outputs, n_batch, n_freq))
+        self.Sxy = np.zeros((n_outputs, n_batch, n_freq), dtype=complex)
+
+    def push(self, x: np.ndarray, y: np.ndarray):
+        """
+        Add one sample: input x shaped (n_batch,) and outputs y shaped (n_outputs, n_batch).
+        """
+        self._buf[0, :, self._fill] = x
+        self._buf[1:, :, self._fill] = y
+        self._fill += 1
+
+        if self._fill == self.nperseg:
+            self._process()
+            self._buf[..., : -self.hop] = self._buf[..., self.hop :]
+            self._fill = self.nperseg - self.hop
+
+    def _process(self):
+        seg = self._buf - self._buf.mean(axis=-1, keepdims=True)
+        spec = np.fft.rfft(seg * self.window, axis=-1)
+        X, Y = spec[0], spec[1:]
+
+        self.Sxx += np.abs(X) ** 2
+        self.Syy += np.abs(Y) ** 2
+        self.Sxy += np.conj(X) * Y
+        self.n_segments += 1
+
+    def transfer_function(self) -> np.ndarray:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            H = self.Sxy / self.Sxx
+        H[self.Syy == 0] = np.nan  # output never moved, there's no response to measure
+        return H
+
+    def coherence(self) -> np.ndarray:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.abs(self.Sxy) ** 2 / (self.Sxx * self.Syy)
+
+
+@dataclass
+class FrequencyResponse:
+    control: str
+    outputs: tuple[str, ...]
+    amplitudes_rad: np.ndarray  # (n_amplitudes,)
+    freq_hz: np.ndarray  # (n_freq,)
+    H: np.ndarray  # (n_outputs, n_amplitudes, n_freq), output units per rad of input
+    coherence: np.ndarray  # same shape as H
+
+    # Trim point the sweep was run around
+    altitude_m: float = 0.0
+    tas_m_s: float = 0.0
+    fpa_rad: float = 0.0
+
+    def bode(self, output: str) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Magnitude [dB] and unwrapped phase [deg] for one output, shaped (n_amplitudes, n_freq).
+        """
+        H = self.H[self.outputs.index(output)]
+        return 20 * np.log10(np.abs(H)), np.degrees(np.unwrap(np.angle(H), axis=-1))
+
+
+def run_sweep(
+    props: AircraftPhysicalProperties,
+    coeffs: AircraftCoeffs,
+    altitude_m: float,
+    tas_m_s: float,
+    fpa_rad: float,
+    control: str = "de_rad",
+    amplitudes_rad: Sequence[float] = (0.25e-2, 0.5e-2, 1e-2, 2e-2),
+    signal: str = "chirp",
+    f_min: float = 0.01,
+    f_max: float = 2.0,
+    T: float = 600.0,
+    dt: float = 0.01,
+    nperseg: int = 2**14,
+    outputs: tuple[str, ...] = OUTPUTS,
+) -> FrequencyResponse:
+    """
+    Trim, then sweep `control` about its trim value with every amplitude at once and return the
+    estimated frequency responses between f_min and f_max [Hz].
+
+    The frequency resolution is 1 / (nperseg * dt), so nperseg needs to be long enough to resolve
+    the slowest mode of interest (e.g. the phugoid), and T should cover several segments for
+    the averaging to do much.
+    """
+    if control not in INPUTS:
+        raise ValueError(f"control must be one of {INPUTS}, got '{control}'")
+
+    amplitudes_rad = np.asarray(amplitudes_rad, dtype=float)
+    n_steps = int(round(T / dt))
+    if n_steps < nperseg:
+        raise ValueError(
+            "T is shorter than one analysis segment, increase T or reduce nperseg"
+        )
+
+    trimmed_state = trimmer.trim(altitude_m, tas_m_s, fpa_rad, props, coeffs)
+    state = batch_solver.repeat(trimmed_state, len(amplitudes_rad))
+
+    t = np.arange(n_steps) * dt
+    if signal == "chirp":
+        u = chirp(t, f_min, f_max, T)
+    elif signal == "multisine":
+        u = multisine(t, f_min, f_max, nperseg * dt)
+    else:
+        raise ValueError(f"Unknown signal '{signal}', use 'chirp' or 'multisine'")
+
+    trim_control = getattr(trimmed_state, control)
+    trim_outputs = np.array([getattr(trimmed_state, name) for name in outputs])[:, None]
+    spectra = StreamingSpectra(len(outputs), len(amplitudes_rad), nperseg)
+    y = np.empty((len(outputs), len(amplitudes_rad)))
+
+    for i in range(n_steps):
+        delta = amplitudes_rad * u[i]
+        setattr(state, control, trim_control + delta)
+
+        for j, name in enumerate(outputs):
+            y[j] = getattr(state, name)
+        spectra.push(delta, y - trim_outputs)
+
+        state = batch_solver.step(dt, state, coeffs, props)
+
+    freq_hz = np.fft.rfftfreq(nperseg, dt)
+    band = (freq_hz >= f_min) & (freq_hz <= f_max)
+
+    return FrequencyResponse(
+        control=control,
+        outputs=tuple(outputs),
+        amplitudes_rad=amplitudes_rad,
+        freq_hz=freq_hz[band],
+        H=spectra.transfer_function()[..., band],
+        coherence=spectra.coherence()[..., band],
+        altitude_m=altitude_m,
+        tas_m_s=tas_m_s,
+        fpa_rad=fpa_rad,
+    )
+
+
+def save(path: str, response: FrequencyResponse):
+    """
+    Write a response to a compressed .npz file, in single precision to keep it small.
+    """
+    np.savez_compressed(
+        path,
+        control=response.control,
+        outputs=np.array(response.outputs),
+        amplitudes_rad=response.amplitudes_rad,
+        freq_hz=response.freq_hz,
+        H=response.H.astype(np.complex64),
+        coherence=response.coherence.astype(np.float32),
+        trim=np.array([response.altitude_m, response.tas_m_s, response.fpa_rad]),
+    )
+
+
+def load(path: str) -> FrequencyResponse:
+    with np.load(path) as data:
+        altitude_m, tas_m_s, fpa_rad = data["trim"]
+        return FrequencyResponse(
+            control=str(data["control"]),
+            outputs=tuple(str(name) for name in data["outputs"]),
+            amplitudes_rad=data["amplitudes_rad"],
+            freq_hz=data["freq_hz"],
+            H=data["H"],
+            coherence=data["coherence"],
+            altitude_m=float(altitude_m),
+            tas_m_s=float(tas_m_s),
+            fpa_rad=float(fpa_rad),
+        )
@@ -0,0 +1,247 @@
+"""
+Wind models: steady wind, wind shear near the ground, and Dryden / von Karman turbulence.
+
+The wind is given in the flat-earth inertial frame (x north, y east, z down) and the
+turbulence in body axes. The simulator still integrates the ground-relative body
+velocities; the wind only changes the air-relative velocity seen by the force model.
+
+Turbulence follows MIL-F-8785C. Rather than running the shaping filters every step, whole
+gust sequences are generated ahead of time by shaping white noise in the frequency domain
+(one FFT per block), so during the simulation a gust is just an interpolated array lookup.
+Sequences are cached by seed, so every run in a batch using the same seed shares them.
+"""
+
+from dataclasses import dataclass, field
+
+import numpy as np
+
+import solver
+
+FT2M = 0.3048
+KT2M_S = 0.514444
+
+# Wind speed at 20 ft used to set low altitude turbulence intensity (MIL-F-8785C)
+W20_LIGHT_M_S = 15 * KT2M_S
+W20_MODERATE_M_S = 30 * KT2M_S
+W20_SEVERE_M_S = 45 * KT2M_S
+
+
+@dataclass
+class SteadyWind:
+    speed_m_s: float = 0.0  # horizontal wind speed
+    from_rad: float = 0.0  # direction the wind blows from, clockwise from north (x)
+    down_m_s: float = 0.0  # vertical wind, positive down
+
+    # Shear: if ref_altitude_m is set, speed_m_s is the speed at that altitude and the
+    # speed at other altitudes follows the log profile from MIL-F-8785C. The profile is
+    # only defined up to 1000 ft, so above that the wind stays at its 1000 ft value.
+    ref_altitude_m: float | None = None
+    roughness_m: float = 2 * FT2M  # z0, 0.15 ft for landing (category C), else 2 ft
+
+    def ned(self, altitude_m):
+        """
+        Wind velocity [north, east, down] at an altitude (scalar or array).
+        """
+        speed = self.speed_m_s
+        if self.ref_altitude_m is not None:
+            h = np.minimum(np.maximum(altitude_m, self.roughness_m), 1000 * FT2M)
+            speed = (
+                speed
+                * np.log(h / self.roughness_m)
+                / np.log(self.ref_altitude_m / self.roughness_m)
+            )
+
+        # Blowing *from* from_rad means moving towards from_rad + pi
+        north = -speed * np.cos(self.from_rad)
+        east = -speed * np.sin(self.from_rad)
+        down = np.full_like(north, self.down_m_s, dtype=float)
+        return np.array([north, east, down])
+
+
+def scale_lengths(
+    altitude_m: float, model: str = "dryden"
+) -> tuple[float, float, float]:
+    """
+    Turbulence scale lengths (L_u, L_v, L_w) [m] at an altitude.
+    Low altitude form below 1000 ft, fixed length above 2000 ft, linear in between.
+    """
+    h_ft = min(max(altitude_m / FT2M, 10.0), 2000.0)
+    L_high_ft = 1750.0 if model == "dryden" else 2500.0
+
+    def low(h):
+        L_uv = h / (0.177 + 0.000823 * h) ** 1.2
+        return L_uv, L_uv, h
+
+    if h_ft <= 1000.0:
+        L = low(h_ft)
+    else:
+        frac = (h_ft - 1000.0) / 1000.0
+        L = tuple(l + frac * (L_high_ft - l) for l in low(1000.0))
+
+    return tuple(l * FT2M for l in L)
+
+
+def intensities(altitude_m, w20_m_s: float):
+    """
+    Turbulence standard deviations (sigma_u, sigma_v, sigma_w) [m/s] at an altitude.
+
+    Uses the low altitude relations, which meet at sigma = 0.1 * W20 in every axis at
+    1000 ft. Above that I just hold that value rather than using the probability of
+    exceedance tables - pick W20 to get the intensity you want.
+    """
+    h_ft = np.minimum(np.maximum(altitude_m / FT2M, 10.0), 1000.0)
+    sigma_w = np.full_like(h_ft, 0.1 * w20_m_s, dtype=float)
+    sigma_uv = sigma_w / (0.177 + 0.000823 * h_ft) ** 0.4
+    return np.array([sigma_uv, sigma_uv, sigma_w])
+
+
+def psd(Omega: np.ndarray, L: tuple[float, float, float], model: str = "dryden"):
+    """
+    One-sided spatial PSDs of the u, v, w gusts for unit sigma, at spatial frequencies Omega [rad/m].
+    """
+    L_u, L_v, L_w = L
+    if model == "dryden":
+        Phi_u = 2 * L_u / np.pi / (1 + (L_u * Omega) ** 2)
+        Phi_v = (
+            L_v / np.pi * (1 + 3 * (L_v * Omega) ** 2) / (1 + (L_v * Omega) ** 2) ** 2
+        )
+        Phi_w = (
+            L_w / np.pi * (1 + 3 * (L_w * Omega) ** 2) / (1 + (L_w * Omega) ** 2) ** 2
+        )
+    elif model == "von_karman":
+        a = 1.339
+        Phi_u = 2 * L_u / np.pi / (1 + (a * L_u * Omega) ** 2) ** (5 / 6)
+        Phi_v = (
+            L_v
+            / np.pi
+            * (1 + 8 / 3 * (a * L_v * Omega) ** 2)
+            / (1 + (a * L_v * Omega) ** 2) ** (11 / 6)
+        )
+        Phi_w = (
+            L_w
+            / np.pi
+            * (1 + 8 / 3 * (a * L_w * Omega) ** 2)
+            / (1 + (a * L_w * Omega) ** 2) ** (11 / 6)
+        )
+    else:
+        raise ValueError(f"Unknown turbulence model '{model}'")
+
+    return np.array([Phi_u, Phi_v, Phi_w])
+
+
+# Unit-sigma gust sequences, keyed by (seed, model, L, ds, n)
+_sequence_cache: dict[tuple, np.ndarray] = {}
+
+
+def unit_gust_sequences(
+    seeds: list[int],
+    L: tuple[float, float, float],
+    ds: float,
+    n: int,
+    model: str = "dryden",
+) -> np.ndarray:
+    """
+    Unit-sigma u, v, w gust sequences sampled every ds metres flown, shape (3, len(seeds), n).
+
+    Any seeds not already cached are generated together: white noise for all of them is
+    shaped in one rfft/irfft pass. The sequences are periodic, so choose n to cover the
+    distance you'll fly or accept that the gusts repeat.
+    """
+    keys = [(seed, model, tuple(L), ds, n) for seed in seeds]
+    missing = list(dict.fromkeys(k for k in keys if k not in _sequence_cache))
+
+    if missing:
+        noise = np.stack(
+            [np.random.default_rng(k[0]).standard_normal((3, n)) for k in missing]
+        )
+
+        # Shape the noise with H = sqrt(Phi * pi / ds), which gives the sequence
+        # variance = integral of Phi over positive frequencies = 1
+        Omega = 2 * np.pi * np.fft.rfftfreq(n, d=ds)
+        H = np.sqrt(psd(Omega, L, model) * np.pi / ds)
+        H[:, 0] = 0.0  # mean wind is handled separately
+        shaped = np.fft.irfft(np.fft.rfft(noise, axis=-1) * H, n=n, axis=-1)
+
+        for k, seq in zip(missing, shaped):
+            seq.flags.writeable = False
+            _sequence_cache[k] = seq
+
+    return np.stack([_sequence_cache[k] for k in keys], axis=1)
+
+
+def clear_cache():
+    _sequence_cache.clear()
+
+
+class Turbulence:
+    """
+    Pre-generated body axis gusts for one run, or a batch of runs (one seed each).
+
+    The sequences are generated along the flight path assuming the turbulence is frozen
+    and flown through at tas_m_s, with scale lengths fixed at altitude_m. The intensity
+    is still updated with the current altitude each time it's sampled.
+    """
+
+    def __init__(
+        self,
+        w20_m_s: float,
+        altitude_m: float,
+        tas_m_s: float,
+        dt: float,
+        duration_s: float,
+        seed: int | list[int] = 0,
+        model: str = "dryden",
+    ):
+        self.w20_m_s = w20_m_s
+        self.dt = dt
+
+        n = int(np.ceil(duration_s / dt)) + 2
+        seeds = [seed] if np.isscalar(seed) else list(seed)
+        L = scale_lengths(altitude_m, model)
+        seq = unit_gust_sequences(seeds, L, tas_m_s * dt, n, model)
+        # (3, n) for a single seed, (3, batch, n) for a list
+        self._seq = seq[:, 0, :] if np.isscalar(seed) else seq
+
+    def body(self, t: float, altitude_m) -> np.ndarray:
+        """
+        Gust velocity [u, v, w] in body axes at time t. Shape (3,) or (3, batch).
+        """
+        i = t / self.dt
+        i0 = int(i) % (self._seq.shape[-1] - 1)
+        frac = i - int(i)
+        unit = (1 - frac) * self._seq[..., i0] + frac * self._seq[..., i0 + 1]
+        sigma = intensities(altitude_m, self.w20_m_s)
+        if self._seq.ndim == 3:
+            # (3, 1) for a scalar altitude, (3, batch) for one altitude per run
+            sigma = sigma.reshape(3, -1)
+        return sigma * unit
+
+
+@dataclass
+class WindModel:
+    steady: SteadyWind = field(default_factory=SteadyWind)
+    turbulence: Turbulence | None = None
+
+    def sample(self, t: float, altitude_m) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (wind_ned, gust_b) at time t, ready to pass to solver.step.
+        """
+        wind_ned = self.steady.ned(altitude_m)
+        if self.turbulence is None:
+            return wind_ned, np.zeros_like(wind_ned)
+        return wind_ned, self.turbulence.body(t, altitude_m)
+
+
+def ground_relative(state, wind_ned):
+    """
+    The trimmer finds an air-relative state. This adds the wind to its body velocities so
+    the aircraft starts off in trim in a steady wind. Modifies and returns state.
+    """
+    R_bi = solver.rotation_body_from_inertial(
+        state.phi_rad, state.tht_rad, state.psi_rad
+    )
+    wind_b = R_bi @ np.asarray(wind_ned)
+    state.u_m_s += wind_b[0]
+    state.v_m_s += wind_b[1]
+    state.w_m_s += wind_b[2]
+    return state